@@ -0,0 +1,588 @@
+import asyncio
+import functools
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from .checkpoint import add_checkpoints, split_by_duration
+from .feedplan import plan_feed_rates
+from .gcode import toolpath_stats
+from .ingest import ingest_svg, page_transform
+from .penlift import join_short_gaps
+from .preflight import (
+    DEFAULT_COST_MODEL_PATH,
+    MIN_FILES,
+    MIN_SAMPLES,
+    CostModel,
+    PipelinePlan,
+    choose_plan,
+    fit_to_area,
+    scan_svg,
+)
+from .utils import (
+    build_layer_pipeline,
+    get_svg_dimensions,
+    load_settings,
+    update_vpype_config_with_z_settings,
+)
+
+# Parts written by split_minutes
+PART_FILE = re.compile(r"_part\d+\.gcode$")
+
+
+@dataclass
+class GcodeFile:
+    """One G-code file written by a job, with its toolpath statistics."""
+
+    path: str
+    draw_distance: float = 0.0
+    travel_distance: float = 0.0
+    pen_lifts: int = 0
+    checkpoints: int = 0
+    parts: List[str] = field(default_factory=list)
+    joined: Optional[dict] = None
+    planned: Optional[dict] = None
+
+
+@dataclass
+class ProcessResult:
+    """Outcome of processing one SVG file."""
+
+    svg_file: str
+    output_folder: str
+    width: float
+    height: float
+    files: List[GcodeFile] = field(default_factory=list)
+    paths: Optional[int] = None
+    vertices: Optional[int] = None
+    layers: Optional[int] = None
+    plan: Optional[PipelinePlan] = None
+    timings: dict = field(default_factory=dict)
+    log: str = ""
+
+    @property
+    def gcode_files(self):
+        return [gcode.path for gcode in self.files]
+
+    @property
+    def draw_distance(self):
+        return sum(gcode.draw_distance for gcode in self.files)
+
+    @property
+    def travel_distance(self):
+        return sum(gcode.travel_distance for gcode in self.files)
+
+    @property
+    def pen_lifts(self):
+        return sum(gcode.pen_lifts for gcode in self.files)
+
+
+async def _run_vpype(args):
+    """Run vpype with the given arguments and return its output."""
+    command = ["vpype", *args]
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    try:
+        output, _ = await process.communicate()
+    except asyncio.CancelledError:
+        # Do not leave vpype running on files that are about to be removed
+        process.kill()
+        await process.wait()
+        raise
+    output = output.decode(errors="replace")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, output)
+    return output
+
+
+async def _in_thread(function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def _run_streaming(
+    svg_file,
+    config_path,
+    layer_pipeline,
+    width,
+    height,
+    area_width,
+    area_height,
+    tolerance,
+    memory_budget,
+    workers=1,
+):
+    """
+    Process a large SVG one stroke layer at a time.
+
+    The SVG is streamed into per-layer spill files with bounded memory, and
+    vpype runs once per layer, loading that layer's spill files with the
+    readspill plugin command, scaled and centered on the plotting area. Only
+    one layer is held in memory by each vpype run. Up to workers layers are
+    processed at once.
+
+    Returns:
+        tuple: (IngestResult, vpype output).
+    """
+    spill_dir = tempfile.mkdtemp(prefix="plotter_spill_")
+    semaphore = asyncio.Semaphore(max(workers, 1))
+
+    async def run_layer(layer):
+        async with semaphore:
+            scale, offset_x, offset_y = page_transform(
+                ingest.bounds, width, height, area_width, area_height
+            )
+            try:
+                return await _run_vpype(
+                    ["-c", config_path, "readspill"]
+                    + ["--stroke", layer.stroke, "--scale", repr(scale)]
+                    + ["--offset", repr(offset_x), repr(offset_y)]
+                    + ["--page-size", repr(area_width), repr(area_height)]
+                    + [layer.base_path]
+                    + shlex.split(layer_pipeline)
+                )
+            finally:
+                layer.remove()
+
+    try:
+        ingest = await _in_thread(
+            ingest_svg, svg_file, spill_dir, tolerance, memory_budget
+        )
+        tasks = [asyncio.ensure_future(run_layer(layer)) for layer in ingest.layers]
+        try:
+            log = await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other layers before their spill files are removed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return ingest, "".join(log)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _move_into(path, folder):
+    """
+    Move a finished file into folder, replacing any file of the same name.
+
+    Parts split from an earlier version of a G-code file no longer match it,
+    so they are removed when the file is replaced.
+    """
+    name = os.path.basename(path)
+    destination = os.path.join(folder, name)
+    if not PART_FILE.search(name):
+        stem = os.path.splitext(name)[0]
+        for file in os.listdir(folder):
+            if file.startswith(f"{stem}_part") and PART_FILE.search(file):
+                os.unlink(os.path.join(folder, file))
+    os.replace(path, destination)
+    return destination
+
+
+def _flattening_tolerance(svg_file, width):
+    """Curve flattening tolerance in SVG user units: 0.1mm once scaled."""
+    svg_width, _ = get_svg_dimensions(svg_file)
+    return 0.1 * svg_width / width if svg_width else 0.1
+
+
+async def preflight_async(svg_file, width, settings=None, model=None):
+    """
+    Scan an SVG and pick the processing settings that suit it.
+
+    Parameters:
+        svg_file (str): Path to the SVG file.
+        width (float): Width the drawing is scaled to, in mm.
+        settings (dict): Settings in the settings.yaml layout; loaded from
+            the package when None.
+        model (CostModel): Cost model; the calibrated model of this machine,
+            or the default one, when None.
+
+    Returns:
+        tuple: (SvgProfile, PipelinePlan).
+    """
+    general = (settings or load_settings())["general"]
+    if model is None:
+        model = CostModel.load(general.get("cost_model_path", DEFAULT_COST_MODEL_PATH))
+    profile = await _in_thread(
+        scan_svg, svg_file, width, _flattening_tolerance(svg_file, width)
+    )
+    plan = choose_plan(
+        profile,
+        model,
+        general.get("preflight_time_budget", 120),
+        general.get("memory_budget_mb", 256) * 1024 * 1024,
+    )
+    return profile, plan
+
+
+async def process_async(
+    svg_file,
+    width,
+    height,
+    *,
+    settings=None,
+    output_folder=None,
+    dedupe=True,
+    stream=False,
+    join_gap=None,
+    plan_feeds=False,
+    checkpoint_minutes=None,
+    split_minutes=None,
+    passes=2000,
+    simplify_tolerance=None,
+    workers=1,
+    auto=False,
+    semaphore=None,
+):
+    """
+    Turn an SVG file into one G-code file per stroke colour.
+
+    This is the non-interactive core of the process command: the drawing is
+    scaled to width x height, centered on the plotting area, optimized by
+    vpype and written as G-code, which then goes through the optional
+    post-processing stages. Nothing is prompted or printed. vpype runs in a
+    subprocess and the post-processing in worker threads, so many jobs can
+    share one event loop.
+
+    Parameters:
+        svg_file (str): Path to the SVG file.
+        width (float): Width to scale the drawing to, in mm.
+        height (float): Height to scale the drawing to, in mm.
+        settings (dict): Settings in the settings.yaml layout; loaded from
+            the package when None.
+        output_folder (str): Destination of the G-code files. Defaults to a
+            folder named after the SVG, next to it. Files of the same name
+            are replaced; other files in the folder are left alone.
+        dedupe (bool): Remove duplicate and overlapping strokes.
+        stream (bool): Ingest the SVG with bounded memory, one layer at a time.
+        join_gap (float): Draw over pen-up travels up to this long, in mm;
+            None skips the stage.
+        plan_feeds (bool): Plan draw feed rates from segment lengths and corners.
+        checkpoint_minutes (float): Interval between checkpoints in estimated
+            minutes; None writes no checkpoints.
+        split_minutes (float): Split files into parts of about this many
+            estimated minutes; None keeps them whole.
+        passes (int): Number of two-opt passes; 0 only runs the greedy sort.
+        simplify_tolerance (float): Simplify lines to this tolerance in mm
+            before merging them; None keeps every vertex.
+        workers (int): Number of layers processed at once when streaming.
+        auto (bool): Scan the file first and let the pre-flight plan choose
+            passes, simplify_tolerance and workers, and turn on stream.
+        semaphore (asyncio.Semaphore): Held for the whole job, to bound the
+            number of jobs running at once.
+
+    Returns:
+        ProcessResult: Output files, geometry statistics and stage timings.
+
+    Raises:
+        ValueError: If the file is not an SVG.
+        subprocess.CalledProcessError: If a vpype run fails.
+    """
+    if not svg_file.lower().endswith(".svg"):
+        raise ValueError(f"The file must be an SVG: {svg_file}")
+    if semaphore is not None:
+        async with semaphore:
+            return await process_async(
+                svg_file,
+                width,
+                height,
+                settings=settings,
+                output_folder=output_folder,
+                dedupe=dedupe,
+                stream=stream,
+                join_gap=join_gap,
+                plan_feeds=plan_feeds,
+                checkpoint_minutes=checkpoint_minutes,
+                split_minutes=split_minutes,
+                passes=passes,
+                simplify_tolerance=simplify_tolerance,
+                workers=workers,
+                auto=auto,
+            )
+
+    started = time.perf_counter()
+    settings = settings or load_settings()
+    general = settings["general"]
+    area_width = general["area_width"]
+    area_height = general["area_height"]
+    z_up = general.get("z_up", 20)
+    z_down = general.get("z_down", 0)
+    feed_rate_draw = general.get("feed_rate_draw", 3000)
+    feed_rate_travel = general.get("feed_rate_travel", 6000)
+    feed_rate_z = general.get("feed_rate_z", 1500)
+
+    name = os.path.splitext(os.path.basename(svg_file))[0]
+    if output_folder is None:
+        output_folder = os.path.join(os.path.dirname(svg_file), name)
+    os.makedirs(output_folder, exist_ok=True)
+    result = ProcessResult(svg_file, output_folder, width, height)
+    timings = result.timings
+
+    if auto:
+        stage = time.perf_counter()
+        profile, result.plan = await preflight_async(svg_file, width, settings)
+        result.paths = profile.paths
+        result.vertices = profile.vertices
+        result.layers = len(profile.layers)
+        stream = stream or result.plan.stream
+        passes = result.plan.passes
+        simplify_tolerance = result.plan.simplify_tolerance
+        workers = result.plan.workers
+        timings["preflight"] = time.perf_counter() - stage
+
+    config_path = update_vpype_config_with_z_settings(
+        z_up,
+        z_down,
+        feed_rate_draw,
+        feed_rate_travel,
+        feed_rate_z,
+        general.get("area_width", 385),
+        general.get("area_height", 460),
+    )
+    # vpype and the post-processing stages work in a folder of this job, so
+    # only its own files are processed, even in a folder shared with others
+    job_folder = tempfile.mkdtemp(prefix=f".{name}_", dir=output_folder)
+    output_path = os.path.join(job_folder, f"{name}_%_color%.gcode")
+
+    try:
+        layer_pipeline = build_layer_pipeline(
+            output_path,
+            area_width,
+            area_height,
+            general.get("registration_marks_length", 4),
+            general.get("dedupe_tolerance", 0.05) if dedupe else None,
+            passes,
+            simplify_tolerance,
+        )
+        stage = time.perf_counter()
+        if stream:
+            memory_budget_mb = general.get("memory_budget_mb", 256)
+            ingest, result.log = await _run_streaming(
+                svg_file,
+                config_path,
+                layer_pipeline,
+                width,
+                height,
+                area_width,
+                area_height,
+                tolerance=_flattening_tolerance(svg_file, width),
+                memory_budget=memory_budget_mb * 1024 * 1024,
+                workers=workers,
+            )
+            result.paths = ingest.paths
+            result.vertices = ingest.vertices
+            result.layers = len(ingest.layers)
+        else:
+            result.log = await _run_vpype(
+                ["-c", config_path, "read", "--attr", "stroke", svg_file]
+                + ["scaleto", f"{width}mm", f"{height}mm"]
+                + ["layout", f"{area_width}mmx{area_height}mm"]
+                + shlex.split(layer_pipeline)
+            )
+        timings["vpype"] = time.perf_counter() - stage
+
+        gcode_paths = [
+            os.path.join(job_folder, file)
+            for file in sorted(os.listdir(job_folder))
+            if file.endswith(".gcode")
+        ]
+        for stage_name in ("join", "plan", "checkpoints", "stats", "split"):
+            timings[stage_name] = 0.0
+
+        for gcode_path in gcode_paths:
+            gcode = GcodeFile(gcode_path)
+            result.files.append(gcode)
+
+            # Joining runs first so checkpoints only land on real pen lifts
+            stage = time.perf_counter()
+            if join_gap is not None:
+                gcode.joined = await _in_thread(
+                    join_short_gaps,
+                    gcode_path,
+                    join_gap,
+                    z_up,
+                    z_down,
+                    feed_rate_draw,
+                    feed_rate_travel,
+                    general.get("join_inked_tolerance", 0.05) or None,
+                    inked_window=general.get("join_inked_window", 100_000),
+                )
+            timings["join"] += time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            if plan_feeds:
+                gcode.planned = await _in_thread(
+                    plan_feed_rates,
+                    gcode_path,
+                    general.get("feed_rate_draw_max", feed_rate_draw),
+                    general.get("acceleration", 500),
+                    general.get("junction_deviation", 0.02),
+                    z_up=z_up,
+                    z_down=z_down,
+                    feed_rate_travel=feed_rate_travel,
+                )
+            timings["plan"] += time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            if checkpoint_minutes is not None:
+                gcode.checkpoints = await _in_thread(
+                    add_checkpoints,
+                    gcode_path,
+                    checkpoint_minutes,
+                    z_up,
+                    z_down,
+                    feed_rate_travel,
+                )
+            timings["checkpoints"] += time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            stats = await _in_thread(toolpath_stats, gcode_path, z_up, z_down)
+            gcode.draw_distance = stats["draw_distance"]
+            gcode.travel_distance = stats["travel_distance"]
+            gcode.pen_lifts = stats["pen_lifts"]
+            timings["stats"] += time.perf_counter() - stage
+
+            stage = time.perf_counter()
+            if split_minutes:
+                gcode.parts = await _in_thread(
+                    split_by_duration,
+                    gcode_path,
+                    split_minutes,
+                    z_up,
+                    z_down,
+                    feed_rate_travel,
+                    feed_rate_z,
+                )
+            timings["split"] += time.perf_counter() - stage
+
+        for gcode in result.files:
+            gcode.path = _move_into(gcode.path, output_folder)
+            gcode.parts = [_move_into(part, output_folder) for part in gcode.parts]
+    finally:
+        if os.path.exists(config_path):
+            os.unlink(config_path)
+        shutil.rmtree(job_folder, ignore_errors=True)
+
+    timings["total"] = time.perf_counter() - started
+    return result
+
+
+async def process_many(jobs, max_concurrency=None, **options):
+    """
+    Process several SVG files concurrently on the running event loop.
+
+    Parameters:
+        jobs (iterable): (svg_file, width, height) tuples.
+        max_concurrency (int): Largest number of jobs running at once;
+            defaults to the number of CPUs.
+        **options: Keyword arguments passed to process_async for every job.
+
+    Returns:
+        list: One ProcessResult per job, in order, or the exception raised
+            by that job, so one failure does not cancel the other jobs.
+    """
+    semaphore = asyncio.BoundedSemaphore(max_concurrency or os.cpu_count() or 1)
+    return await asyncio.gather(
+        *(
+            process_async(svg_file, width, height, semaphore=semaphore, **options)
+            for svg_file, width, height in jobs
+        ),
+        return_exceptions=True,
+    )
+
+
+async def calibrate_async(corpus_dir, settings=None, passes=(0, 100, 500)):
+    """
+    Fit a cost model by processing every SVG of a benchmark corpus.
+
+    Each file is scaled to fit the plotting area and processed once per
+    passes value, one run at a time so the timings are not disturbed, and
+    the measured vpype time and G-code size are fitted against the scanned
+    geometry counts.
+
+    Parameters:
+        corpus_dir (str): Folder of benchmark SVG files.
+        settings (dict): Settings in the settings.yaml layout; loaded from
+            the package when None.
+        passes (tuple): Two-opt pass counts to benchmark each file with;
+            they should span the counts choose_plan picks from.
+
+    Returns:
+        CostModel: The fitted model, not yet saved.
+
+    Raises:
+        ValueError: If the folder has fewer than MIN_FILES SVG files, or
+            they give fewer than MIN_SAMPLES runs.
+    """
+    settings = settings or load_settings()
+    general = settings["general"]
+    area_width = general["area_width"]
+    area_height = general["area_height"]
+    svg_files = sorted(
+        os.path.join(corpus_dir, file)
+        for file in os.listdir(corpus_dir)
+        if file.lower().endswith(".svg")
+    )
+    if not svg_files:
+        raise ValueError(f"No SVG files found in {corpus_dir}")
+    if len(svg_files) < MIN_FILES:
+        raise ValueError(
+            f"{len(svg_files)} SVG files cannot separate the cost model "
+            f"features: the corpus needs at least {MIN_FILES} files"
+        )
+    if len(svg_files) * len(passes) < MIN_SAMPLES:
+        raise ValueError(
+            f"{len(svg_files)} SVG files benchmarked with {len(passes)} pass "
+            f"counts give fewer than the {MIN_SAMPLES} runs needed to fit the "
+            "cost model: add files to the corpus"
+        )
+
+    samples = []
+    output_folder = tempfile.mkdtemp(prefix="plotter_calibrate_")
+    try:
+        for svg_file in svg_files:
+            width, height = fit_to_area(
+                *get_svg_dimensions(svg_file), area_width, area_height
+            )
+            profile = await _in_thread(
+                scan_svg, svg_file, width, _flattening_tolerance(svg_file, width)
+            )
+            for count in passes:
+                result = await process_async(
+                    svg_file,
+                    width,
+                    height,
+                    settings=settings,
+                    output_folder=output_folder,
+                    passes=count,
+                )
+                samples.append(
+                    {
+                        "layers": profile.counts,
+                        "passes": count,
+                        "seconds": result.timings["vpype"],
+                        "bytes": sum(
+                            os.path.getsize(path) for path in result.gcode_files
+                        ),
+                    }
+                )
+                for path in result.gcode_files:
+                    os.unlink(path)
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+    return CostModel.fit(samples)
+
+
+def process(svg_file, width, height, **options):
+    """Run process_async to completion, for callers without an event loop."""
+    return asyncio.run(process_async(svg_file, width, height, **options))
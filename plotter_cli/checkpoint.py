@@ -0,0 +1,285 @@
+import os
+import re
+
+from .gcode import MachineState, parse_line, write_atomically
+
+CHECKPOINT_PREFIX = "; CHECKPOINT"
+
+_CHECKPOINT = re.compile(r"^; CHECKPOINT (\d+)\b")
+
+
+class Boundary:
+    """A polyline boundary: the pen is up and the machine state is known."""
+
+    def __init__(self, line, elapsed, state):
+        self.line = line
+        self.elapsed = elapsed
+        self.state = state
+
+
+def format_duration(minutes):
+    """Format a duration in minutes as h:mm:ss."""
+    seconds = int(round(minutes * 60))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _has_xy(line):
+    words, _ = parse_line(line)
+    return "X" in words or "Y" in words
+
+
+def scan_program(gcode_file, interval=0, z_up=20, z_down=0, feed_rate_travel=6000):
+    """
+    Find the polyline boundaries of a G-code program and time them.
+
+    A boundary is the first line at which the pen is up again after having
+    drawn. Starting a program at a boundary only requires the pen to be up
+    and the modal state to be restored. Only the first boundary after every
+    interval of estimated time is kept.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        interval (float): Minimum estimated minutes between two kept
+            boundaries; 0 keeps every boundary.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+
+    Returns:
+        dict: "boundaries" (list of Boundary, excluding the closing lines),
+            "header_end" (index of the first line with an XY move),
+            "footer_start" (index of the line after the last pen lift) and
+            "duration" (estimated minutes for the whole program).
+    """
+    state = MachineState(z_up, z_down, feed_rate_travel)
+    boundaries = []
+    elapsed = 0.0
+    last_kept = 0.0
+    header_end = None
+    footer_start = None
+    has_drawn = False
+
+    with open(gcode_file) as gcode:
+        for index, line in enumerate(gcode):
+            if has_drawn and not state.pen_down:
+                has_drawn = False
+                if elapsed - last_kept >= interval:
+                    boundaries.append(Boundary(index, elapsed, state.copy()))
+                    last_kept = elapsed
+            down = state.pen_down
+            elapsed += state.apply(line)
+            if header_end is None and _has_xy(line):
+                header_end = index
+            if state.pen_down:
+                has_drawn = True
+            elif down:
+                footer_start = index + 1
+
+    if footer_start is not None:
+        boundaries = [b for b in boundaries if b.line < footer_start]
+    return {
+        "boundaries": boundaries,
+        "header_end": header_end or 0,
+        "footer_start": footer_start,
+        "duration": elapsed,
+    }
+
+
+def _resume_header(header_lines, state, z_up, feed_rate_z, comment):
+    """Lines that bring a machine to the state saved at a boundary."""
+    lines = list(header_lines)
+    lines.append(f"; {comment}\n")
+    lines.append("G21 ; Set units to mm\n")
+    lines.append("G90 ; Absolute positioning\n")
+    lines.append(f"G1 Z{z_up} F{feed_rate_z} ; Pen up\n")
+    lines.append(f"G0 X{state.x:.4f} Y{state.y:.4f} ; Move to resume position\n")
+    if state.inches:
+        lines.append("G20 ; Restore inch units\n")
+    if state.relative:
+        lines.append("G91 ; Restore relative positioning\n")
+    if state.feed:
+        feed = state.feed / 25.4 if state.inches else state.feed
+        lines.append(f"F{feed:g} ; Restore feed rate\n")
+    return lines
+
+
+def add_checkpoints(
+    gcode_file, interval=0, z_up=20, z_down=0, feed_rate_travel=6000
+):
+    """
+    Insert numbered checkpoint markers at polyline boundaries, in place.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        interval (float): Minimum estimated minutes between two checkpoints;
+            0 puts a checkpoint at every polyline boundary.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+
+    Returns:
+        int: Number of checkpoints written.
+    """
+    scan = scan_program(gcode_file, interval, z_up, z_down, feed_rate_travel)
+    markers = {}
+    for number, boundary in enumerate(scan["boundaries"], start=1):
+        markers[boundary.line] = (
+            f"{CHECKPOINT_PREFIX} {number} at {format_duration(boundary.elapsed)}"
+            f" X{boundary.state.x:.4f} Y{boundary.state.y:.4f}\n"
+        )
+
+    def lines():
+        with open(gcode_file) as gcode:
+            for index, line in enumerate(gcode):
+                if index in markers:
+                    yield markers[index]
+                # Markers from an earlier run are replaced, not duplicated
+                if not _CHECKPOINT.match(line):
+                    yield line
+
+    write_atomically(gcode_file, lines())
+    return len(markers)
+
+
+def split_by_duration(
+    gcode_file,
+    minutes,
+    z_up=20,
+    z_down=0,
+    feed_rate_travel=6000,
+    feed_rate_z=1500,
+):
+    """
+    Split a G-code program into parts of about the given estimated duration.
+
+    Parts are cut at polyline boundaries. Every part after the first starts
+    with the original header and restores the pen-up state, and every part
+    before the last ends with the original closing lines.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        minutes (float): Target duration of each part.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+        feed_rate_z (int): Feed rate for Z-axis movements in mm/min.
+
+    Returns:
+        list: Paths of the written parts; empty when the program is shorter
+            than one part.
+    """
+    scan = scan_program(gcode_file, minutes, z_up, z_down, feed_rate_travel)
+    cuts = scan["boundaries"]
+    if not cuts:
+        return []
+
+    # Header and closing lines are short, so they are kept in memory
+    header_end, footer_start = scan["header_end"], scan["footer_start"]
+    header, footer = [], []
+    with open(gcode_file) as gcode:
+        for index, line in enumerate(gcode):
+            if index < header_end:
+                header.append(line)
+            elif footer_start is not None and index >= footer_start:
+                footer.append(line)
+
+    stem = os.path.splitext(gcode_file)[0]
+    total = len(cuts) + 1
+    parts = [f"{stem}_part{number:02d}.gcode" for number in range(1, total + 1)]
+    cut_lines = {cut.line: number for number, cut in enumerate(cuts, start=2)}
+
+    output = open(parts[0], "w")
+    try:
+        with open(gcode_file) as gcode:
+            for index, line in enumerate(gcode):
+                number = cut_lines.get(index)
+                if number is not None:
+                    output.writelines(footer)
+                    output.close()
+                    cut = cuts[number - 2]
+                    output = open(parts[number - 1], "w")
+                    output.writelines(
+                        _resume_header(
+                            header,
+                            cut.state,
+                            z_up,
+                            feed_rate_z,
+                            f"Part {number} of {total}, "
+                            f"from {format_duration(cut.elapsed)}",
+                        )
+                    )
+                output.write(line)
+    finally:
+        output.close()
+    return parts
+
+
+def resume_from_checkpoint(
+    gcode_file,
+    checkpoint,
+    output_path,
+    z_up=20,
+    z_down=0,
+    feed_rate_travel=6000,
+    feed_rate_z=1500,
+):
+    """
+    Write a G-code program that starts at a checkpoint of another program.
+
+    The machine state at the checkpoint is rebuilt by running the program up
+    to the marker, so the output restores units, positioning, feed rate and
+    position with the pen up before continuing with the remaining lines.
+
+    Parameters:
+        gcode_file (str): Path to a G-code file with checkpoint markers.
+        checkpoint (int): Number of the checkpoint to resume from.
+        output_path (str): Destination of the resumed program.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+        feed_rate_z (int): Feed rate for Z-axis movements in mm/min.
+
+    Returns:
+        float: Estimated minutes of plotting skipped.
+
+    Raises:
+        ValueError: If the file has no such checkpoint.
+    """
+    state = MachineState(z_up, z_down, feed_rate_travel)
+    skipped = {"minutes": 0.0}
+
+    def lines():
+        header = []
+        in_header = True
+        found = False
+        with open(gcode_file) as gcode:
+            for line in gcode:
+                if found:
+                    yield line
+                    continue
+                match = _CHECKPOINT.match(line)
+                if match and int(match.group(1)) == checkpoint:
+                    found = True
+                    yield from _resume_header(
+                        header,
+                        state,
+                        z_up,
+                        feed_rate_z,
+                        f"Resumed from checkpoint {checkpoint} of "
+                        f"{os.path.basename(gcode_file)}",
+                    )
+                    yield line
+                    continue
+                skipped["minutes"] += state.apply(line)
+                # The header is everything before the first XY move
+                if in_header and _has_xy(line):
+                    in_header = False
+                if in_header:
+                    header.append(line)
+        if not found:
+            raise ValueError(f"Checkpoint {checkpoint} not found in {gcode_file}")
+
+    # Written to a temporary file first, so output_path may be gcode_file
+    # and is left untouched when the checkpoint is missing
+    write_atomically(output_path, lines())
+    return skipped["minutes"]
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import subprocess
 import typer
@@ -15,7 +16,6 @@ from rich.panel import Panel
 app = typer.Typer(no_args_is_help=True)
 console = Console()
 
-
 @app.command("list")
 def list_paper_sizes(
     imperial: bool = typer.Option(
@@ -173,8 +173,47 @@ def process(
     imperial: bool = typer.Option(
         False, "--imperial", "-i", help="Use imperial units (in) instead of metric (mm)"
     ),
+    dedupe: bool = typer.Option(
+        True,
+        "--dedupe/--no-dedupe",
+        help="Remove duplicate and overlapping strokes before merging lines",
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Stream the SVG into per-layer files and process one layer at a time; memory is bounded by the largest layer",
+    ),
+    join_gap: float = typer.Option(
+        None,
+        "--join-gap",
+        help="Draw over pen-up travels shorter than N mm, or retracing drawn lines, instead of lifting the pen",
+    ),
+    plan_feeds: bool = typer.Option(
+        False,
+        "--plan-feeds",
+        help="Speed up long straight draw moves and slow down for corners, within the machine limits in settings",
+    ),
+    auto: bool = typer.Option(
+        False,
+        "--auto",
+        help="Scan the file first and pick optimizer passes, simplification, streaming and workers from the cost model",
+    ),
+    checkpoint_minutes: float = typer.Option(
+        None,
+        "--checkpoint-minutes",
+        help="Write a resumable checkpoint at the first polyline boundary after every N minutes of estimated plot time (0 for every polyline)",
+    ),
+    split_minutes: float = typer.Option(
+        None,
+        "--split-minutes",
+        help="Also split each G-code file into parts of about N minutes of estimated plot time",
+    ),
 ):
     """Process an SVG file for plotting."""
+    # Imported here so the other commands do not pay for NumPy
+    from .api import process as process_job
+    from .checkpoint import format_duration
+
     # Validate file extension
     if not svg_file.lower().endswith(".svg"):
         console.print(Panel("[ERROR] The file must be an SVG.", style="bold red"))
@@ -251,78 +290,281 @@ def process(
             * conversion_factor
         )
 
-    area_width = settings["general"]["area_width"]
-    area_height = settings["general"]["area_height"]
+    try:
+        result = process_job(
+            svg_file,
+            custom_width,
+            custom_height,
+            settings=settings,
+            dedupe=dedupe,
+            stream=stream,
+            join_gap=join_gap,
+            plan_feeds=plan_feeds,
+            checkpoint_minutes=checkpoint_minutes,
+            split_minutes=split_minutes,
+            auto=auto,
+        )
+    except subprocess.CalledProcessError as e:
+        if e.output:
+            print(e.output, end="")
+        console.print(
+            Panel(f"[ERROR] Failed to execute vpype command: {e}", style="bold red")
+        )
+        raise typer.Exit(code=1)
+    except OSError as e:
+        # e.g. vpype is not installed or the output folder is not writable
+        console.print(
+            Panel(f"[ERROR] Failed to execute vpype command: {e}", style="bold red")
+        )
+        raise typer.Exit(code=1)
+
+    if result.plan is not None:
+        console.print(_describe_plan(result.plan))
+    if result.log:
+        print(result.log, end="")
+    if result.paths is not None:
+        console.print(
+            f"Read {result.paths} paths ({result.vertices} vertices) "
+            f"in {result.layers} layers"
+        )
+    for gcode in result.files:
+        name = os.path.basename(gcode.path)
+        if gcode.joined is not None:
+            console.print(
+                f"{name}: {gcode.joined['lifts_saved']} pen lifts saved, "
+                f"about {format_duration(gcode.joined['time_saved'])} faster"
+            )
+        if gcode.planned is not None:
+            before = gcode.planned["duration_before"]
+            after = gcode.planned["duration_after"]
+            console.print(
+                f"{name}: planned {gcode.planned['segments']} draw moves, "
+                f"{format_duration(before)} -> {format_duration(after)}"
+                + (f" ({before / after:.2f}x faster)" if after else "")
+            )
+        if checkpoint_minutes is not None:
+            console.print(f"{name}: {gcode.checkpoints} checkpoints written")
+        if split_minutes:
+            console.print(f"{name}: split into {len(gcode.parts) or 1} parts")
+
+    # List the files generated by this job
+    generated_files = [
+        os.path.basename(path)
+        for gcode in result.files
+        for path in [gcode.path] + gcode.parts
+    ]
+    file_list = "\n".join([f"- {file}" for file in generated_files])
 
-    # Construct the vpype command
-    svg_filename = os.path.basename(svg_file)
-    svg_name_without_ext = os.path.splitext(svg_filename)[0]
+    console.print(
+        Panel(
+            f"[SUCCESS] Files processed and saved to: \n{file_list}",
+            style="bold green",
+        )
+    )
 
-    # Create a folder for the output files
-    output_folder = os.path.join(os.path.dirname(svg_file), svg_name_without_ext)
-    os.makedirs(output_folder, exist_ok=True)
 
-    output_path = os.path.join(output_folder, f"{svg_name_without_ext}_%_color%.gcode")
+def _describe_plan(plan):
+    """Summarize a pre-flight plan in a few lines."""
+    from .checkpoint import format_duration
 
-    # Dynamically locate the .vpype.toml file and update it with Z settings and feed rates
-    z_up = settings["general"].get("z_up", 20)
-    z_down = settings["general"].get("z_down", 0)
-    feed_rate_draw = settings["general"].get("feed_rate_draw", 3000)
-    feed_rate_travel = settings["general"].get("feed_rate_travel", 6000)
-    feed_rate_z = settings["general"].get("feed_rate_z", 1500)
-    area_max_x = settings["general"].get("area_width", 385)
-    area_max_y = settings["general"].get("area_height", 460)
-    registration_marks_length = settings["general"].get("registration_marks_length", 4)
-    temp_config_path = update_vpype_config_with_z_settings(
-        z_up,
-        z_down,
-        feed_rate_draw,
-        feed_rate_travel,
-        feed_rate_z,
-        area_max_x,
-        area_max_y,
-    )
+    simplify = f"{plan.simplify_tolerance}mm" if plan.simplify_tolerance else "no"
+    stream = f"yes, {plan.workers} at once" if plan.stream else "no"
+    lines = [
+        f"Two-opt passes: {plan.passes}",
+        f"Simplify: {simplify}",
+        f"Stream layers: {stream}",
+        f"Predicted optimization time: {format_duration(plan.predicted_seconds / 60)}",
+        f"Predicted G-code size: {plan.predicted_bytes / 2**20:.1f}MB",
+    ]
+    lines += [f"- {reason}" for reason in plan.reasons]
+    return "\n".join(lines)
 
-    try:
-        vpype_command = (
-            f"vpype -c {temp_config_path} "
-            f"read --attr stroke {svg_file} "
-            f"scaleto {custom_width}{unit} {custom_height}{unit} "
-            f"layout {area_width}{unit}x{area_height}{unit} "
-            f"forlayer "
-            f"lmove all 999 "
-            f"linemerge linesort --two-opt --passes 2000 "
-            f"rect {registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm "
-            f"rect {area_width - 2 * registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm "
-            f"rect {registration_marks_length}mm {area_height - 2 * registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm "
-            f"rect {area_width - 2 * registration_marks_length}mm {area_height - 2 * registration_marks_length}mm {registration_marks_length}mm {registration_marks_length}mm "
-            f"lmove 1 1 "
-            f"lmove 999 2 "
-            f"gwrite -p penplotte {output_path} "
-            f"end"
-        )
-        # Execute the vpype command
-        subprocess.run(vpype_command, shell=True, check=True)
 
-        # List all generated files in the output folder
-        generated_files = os.listdir(output_folder)
-        file_list = "\n".join([f"- {file}" for file in generated_files])
+@app.command("preflight")
+def preflight(
+    svg_file: str = typer.Argument(..., help="Path to the SVG file"),
+    width: float = typer.Option(
+        None,
+        "--width",
+        "-w",
+        help="Width the drawing will be scaled to in mm (defaults to the largest that fits the plotting area)",
+    ),
+):
+    """
+    Scan an SVG and predict how long processing will take.
+    Counts paths, vertices and layers with a streaming pass, then shows the
+    settings process --auto would pick for this machine.
+    """
+    from .api import preflight_async
+    from .preflight import DEFAULT_COST_MODEL_PATH, CostModel, fit_to_area
 
-        console.print(
-            Panel(
-                f"[SUCCESS] Files processed and saved to: \n{file_list}",
-                style="bold green",
-            )
+    if not os.path.exists(svg_file):
+        console.print(Panel(f"[ERROR] File not found: {svg_file}", style="bold red"))
+        raise typer.Exit(code=1)
+
+    settings = load_settings()
+    if width is None:
+        width, _ = fit_to_area(
+            *get_svg_dimensions(svg_file),
+            settings["general"]["area_width"],
+            settings["general"]["area_height"],
+        )
+    model_path = settings["general"].get("cost_model_path", DEFAULT_COST_MODEL_PATH)
+    model = CostModel.load(model_path)
+    profile, plan = asyncio.run(preflight_async(svg_file, width, settings, model))
+
+    calibration = (
+        f"calibrated from {model.samples} runs"
+        if model.calibrated
+        else "not calibrated, run plotter benchmark for accurate predictions"
+    )
+    console.print(
+        Panel(
+            f"[SUCCESS] Scanned {svg_file} in {profile.scan_seconds:.1f}s\n\n"
+            f"Paths: {profile.paths}\n"
+            f"Vertices: {profile.vertices}\n"
+            f"Layers: {len(profile.layers)}\n"
+            f"Cost model: {calibration}\n\n"
+            f"{_describe_plan(plan)}",
+            style="bold green",
         )
+    )
+
+
+@app.command("benchmark")
+def benchmark(
+    corpus_dir: str = typer.Argument(..., help="Folder of benchmark SVG files"),
+):
+    """
+    Build the cost model used by preflight and process --auto.
+    Every SVG in the folder is processed on this machine and the measured
+    times and G-code sizes are fitted to the geometry counts.
+    """
+    from .api import calibrate_async
+    from .preflight import DEFAULT_COST_MODEL_PATH
+
+    settings = load_settings()
+    model_path = settings["general"].get("cost_model_path", DEFAULT_COST_MODEL_PATH)
+    try:
+        model = asyncio.run(calibrate_async(corpus_dir, settings))
+    except (OSError, ValueError) as e:
+        console.print(Panel(f"[ERROR] {e}", style="bold red"))
+        raise typer.Exit(code=1)
     except subprocess.CalledProcessError as e:
         console.print(
             Panel(f"[ERROR] Failed to execute vpype command: {e}", style="bold red")
         )
         raise typer.Exit(code=1)
-    finally:
-        # Clean up temporary config file
-        if os.path.exists(temp_config_path):
-            os.unlink(temp_config_path)
+
+    model.save(model_path)
+    console.print(
+        Panel(
+            f"[SUCCESS] Cost model fitted from {model.samples} runs and saved to: "
+            f"{model_path}",
+            style="bold green",
+        )
+    )
+
+
+@app.command("preview")
+def preview(
+    gcode_file: str = typer.Argument(..., help="Path to the G-code file"),
+    output: str = typer.Option(
+        None,
+        "--output",
+        "-o",
+        help="Destination PNG (defaults to the G-code path with a .png extension)",
+    ),
+    resolution: float = typer.Option(
+        2.0, "--resolution", "-r", help="Resolution of the preview in pixels per mm"
+    ),
+):
+    """
+    Render the toolpath of a G-code file to a PNG, with a pen-lift heat map.
+    Draw moves are dark blue and travel moves red. The heat map is saved next
+    to the preview with a _lifts suffix.
+    """
+    # Imported here so the other commands do not pay for NumPy
+    from .preview import render_preview
+
+    if not os.path.exists(gcode_file):
+        console.print(Panel(f"[ERROR] File not found: {gcode_file}", style="bold red"))
+        raise typer.Exit(code=1)
+
+    settings = load_settings()
+    png_path = output or os.path.splitext(gcode_file)[0] + ".png"
+    heatmap_path = os.path.splitext(png_path)[0] + "_lifts.png"
+
+    stats = render_preview(
+        gcode_file,
+        png_path,
+        heatmap_path,
+        settings["general"]["area_width"],
+        settings["general"]["area_height"],
+        resolution,
+        settings["general"].get("z_up", 20),
+        settings["general"].get("z_down", 0),
+    )
+
+    console.print(
+        Panel(
+            f"[SUCCESS] Preview saved to:\n"
+            f"- {png_path}\n"
+            f"- {heatmap_path}\n\n"
+            f"Draw distance: {stats['draw_distance'] / 1000:.2f}m\n"
+            f"Travel distance: {stats['travel_distance'] / 1000:.2f}m\n"
+            f"Pen lifts: {stats['pen_lifts']}",
+            style="bold green",
+        )
+    )
+
+
+@app.command("resume")
+def resume(
+    gcode_file: str = typer.Argument(..., help="Path to a G-code file with checkpoints"),
+    checkpoint: int = typer.Option(
+        ..., "--from", "-f", help="Number of the checkpoint to resume from"
+    ),
+    output: str = typer.Option(
+        None,
+        "--output",
+        "-o",
+        help="Destination G-code file (defaults to FILE_from<CHECKPOINT>.gcode)",
+    ),
+):
+    """
+    Write a G-code file that resumes a plot from one of its checkpoints.
+    The new file keeps the original header, lifts the pen and moves to the
+    checkpoint before drawing the rest of the job.
+    """
+    from .checkpoint import format_duration, resume_from_checkpoint
+
+    settings = load_settings()
+    output_path = output or (
+        f"{os.path.splitext(gcode_file)[0]}_from{checkpoint}.gcode"
+    )
+
+    try:
+        skipped = resume_from_checkpoint(
+            gcode_file,
+            checkpoint,
+            output_path,
+            settings["general"].get("z_up", 20),
+            settings["general"].get("z_down", 0),
+            settings["general"].get("feed_rate_travel", 6000),
+            settings["general"].get("feed_rate_z", 1500),
+        )
+    except (OSError, ValueError) as e:
+        console.print(Panel(f"[ERROR] {e}", style="bold red"))
+        raise typer.Exit(code=1)
+
+    console.print(
+        Panel(
+            f"[SUCCESS] Resumed G-code saved to: {output_path}\n"
+            f"Skipped about {format_duration(skipped)} of plotting.",
+            style="bold green",
+        )
+    )
 
 
 @app.command("manage-papers")
@@ -0,0 +1,243 @@
+import math
+
+
+def _box_cells(ax, ay, bx, by, margin, cell_size):
+    """Yield the grid cells covered by a segment's bounding box grown by margin."""
+    i0 = int(math.floor((min(ax, bx) - margin) / cell_size))
+    i1 = int(math.floor((max(ax, bx) + margin) / cell_size))
+    j0 = int(math.floor((min(ay, by) - margin) / cell_size))
+    j1 = int(math.floor((max(ay, by) + margin) / cell_size))
+    for i in range(i0, i1 + 1):
+        for j in range(j0, j1 + 1):
+            yield (i, j)
+
+
+def _segment_cells(ax, ay, bx, by, margin, cell_size):
+    """
+    Return the grid cells within margin of a segment.
+
+    Segments longer than a cell are walked in cell-sized pieces, so a long
+    diagonal only touches the cells along it instead of every cell of its
+    bounding box.
+    """
+    pieces = int(math.ceil(math.hypot(bx - ax, by - ay) / cell_size))
+    if pieces <= 1:
+        return list(_box_cells(ax, ay, bx, by, margin, cell_size))
+    cells = set()
+    dx = (bx - ax) / pieces
+    dy = (by - ay) / pieces
+    for piece in range(pieces):
+        x0 = ax + piece * dx
+        y0 = ay + piece * dy
+        cells.update(_box_cells(x0, y0, x0 + dx, y0 + dy, margin, cell_size))
+    return cells
+
+
+class SegmentGrid:
+    """
+    Spatial hash grid of straight segments.
+
+    Segments are stored in flat coordinate lists and referenced from every
+    cell their (tolerance-grown) bounding box touches, so a lookup only has to
+    look at the segments sharing a few cells with the query.
+    """
+
+    def __init__(self, cell_size, tolerance):
+        self.cell_size = float(cell_size)
+        self.tolerance = float(tolerance)
+        self.cells = {}
+        self.ax = []
+        self.ay = []
+        self.bx = []
+        self.by = []
+
+    def __len__(self):
+        return len(self.ax)
+
+    def add(self, a, b):
+        """Index the segment from complex point a to complex point b."""
+        index = len(self.ax)
+        self.ax.append(a.real)
+        self.ay.append(a.imag)
+        self.bx.append(b.real)
+        self.by.append(b.imag)
+        for cell in _segment_cells(
+            a.real, a.imag, b.real, b.imag, self.tolerance, self.cell_size
+        ):
+            self.cells.setdefault(cell, []).append(index)
+
+    def candidates(self, a, b):
+        """Return the indices of the segments that may lie close to a-b."""
+        found = set()
+        for cell in _segment_cells(
+            a.real, a.imag, b.real, b.imag, self.tolerance, self.cell_size
+        ):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def covered_intervals(self, a, b, max_sin=0.05):
+        """
+        Find the parts of segment a-b already drawn by indexed segments.
+
+        An indexed segment covers a part of a-b when it runs parallel to it
+        (in either direction) and stays within tolerance of it over the
+        overlapping span.
+
+        Parameters:
+            a (complex): Start point of the query segment.
+            b (complex): End point of the query segment.
+            max_sin (float): Largest sine of the angle between two segments
+                for them to be considered parallel.
+
+        Returns:
+            list: (start, end) pairs along a-b, as fractions of its length.
+        """
+        dx = b.real - a.real
+        dy = b.imag - a.imag
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            return []
+        length = math.sqrt(length_sq)
+        tolerance = self.tolerance
+
+        intervals = []
+        for index in self.candidates(a, b):
+            qax = self.ax[index]
+            qay = self.ay[index]
+            qdx = self.bx[index] - qax
+            qdy = self.by[index] - qay
+            q_length = math.hypot(qdx, qdy)
+            if q_length == 0:
+                continue
+            if abs(dx * qdy - dy * qdx) > max_sin * length * q_length:
+                continue
+
+            # Project the indexed segment on a-b and clip it to the query span
+            t0 = ((qax - a.real) * dx + (qay - a.imag) * dy) / length_sq
+            t1 = t0 + (qdx * dx + qdy * dy) / length_sq
+            if t0 == t1:
+                continue
+            lo = max(min(t0, t1), 0.0)
+            hi = min(max(t0, t1), 1.0)
+            if hi <= lo:
+                continue
+
+            # Both clipped ends must stay within tolerance of the query line
+            within = True
+            for t in (lo, hi):
+                s = (t - t0) / (t1 - t0)
+                px = qax + s * qdx - a.real
+                py = qay + s * qdy - a.imag
+                if abs(px * dy - py * dx) > tolerance * length:
+                    within = False
+                    break
+            if within:
+                intervals.append((lo, hi))
+        return intervals
+
+    def covers(self, a, b):
+        """Return True when segment a-b only retraces indexed segments."""
+        length = abs(b - a)
+        if length == 0:
+            return False
+        intervals = self.covered_intervals(a, b)
+        return not _uncovered(intervals, self.tolerance / length)
+
+
+# Covered spans shorter than this fraction of a segment are rounding noise,
+# such as the shared end point of two consecutive segments
+_MIN_COVERAGE = 1e-9
+
+
+def _uncovered(intervals, min_gap):
+    """
+    Return the parts of [0, 1] not covered by intervals, ignoring slivers.
+
+    Slivers are only dropped from segments that are partly covered: a
+    segment without any coverage is kept whole, however short it is.
+    """
+    intervals = [(lo, hi) for lo, hi in intervals if hi - lo > _MIN_COVERAGE]
+    if not intervals:
+        return [(0.0, 1.0)]
+    kept = []
+    cursor = 0.0
+    for lo, hi in sorted(intervals):
+        if lo > cursor:
+            kept.append((cursor, lo))
+        cursor = max(cursor, hi)
+        if cursor >= 1.0:
+            break
+    if cursor < 1.0:
+        kept.append((cursor, 1.0))
+    return [(lo, hi) for lo, hi in kept if hi - lo > min_gap]
+
+
+def _mean_segment_length(lines):
+    total = 0.0
+    count = 0
+    for line in lines:
+        for a, b in zip(line[:-1], line[1:]):
+            total += abs(b - a)
+            count += 1
+    return total / count if count else 0.0
+
+
+def dedupe_lines(lines, tolerance=0.05, cell_size=None):
+    """
+    Remove duplicate and overlapping strokes from a set of polylines.
+
+    Polylines are walked in order and every segment is checked against the
+    segments kept so far. Parts that retrace already drawn geometry within
+    tolerance, in the same or the reversed direction, are trimmed; polylines
+    are split where a trimmed part leaves a gap.
+
+    Parameters:
+        lines (iterable): Polylines as sequences of complex points.
+        tolerance (float): Maximum distance between two strokes for them to
+            be considered the same stroke, in the units of the points.
+        cell_size (float): Size of the spatial hash cells. Defaults to the
+            mean segment length, but never less than four tolerances.
+
+    Returns:
+        tuple: (kept_lines, removed_length) where kept_lines is a list of
+            lists of complex points and removed_length is the total drawing
+            distance that was dropped.
+    """
+    lines = [list(line) for line in lines]
+    if cell_size is None:
+        cell_size = max(_mean_segment_length(lines), 4 * tolerance)
+    cell_size = max(cell_size, 1e-9)
+    grid = SegmentGrid(cell_size, tolerance)
+
+    kept_lines = []
+    removed_length = 0.0
+    for line in lines:
+        current = []
+        for a, b in zip(line[:-1], line[1:]):
+            length = abs(b - a)
+            if length == 0:
+                continue
+            min_gap = tolerance / length
+            pieces = _uncovered(grid.covered_intervals(a, b), min_gap)
+            removed_length += length * (1.0 - sum(hi - lo for lo, hi in pieces))
+
+            for lo, hi in pieces:
+                start = a if lo == 0.0 else a + (b - a) * lo
+                end = b if hi == 1.0 else a + (b - a) * hi
+                if current and lo == 0.0 and current[-1] == a:
+                    current.append(end)
+                else:
+                    if len(current) > 1:
+                        kept_lines.append(current)
+                    current = [start, end]
+                grid.add(start, end)
+            if not pieces or pieces[-1][1] != 1.0:
+                if len(current) > 1:
+                    kept_lines.append(current)
+                current = []
+        if len(current) > 1:
+            kept_lines.append(current)
+
+    return kept_lines, removed_length
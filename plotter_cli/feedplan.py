@@ -0,0 +1,223 @@
+import math
+import re
+
+from .gcode import MachineState, parse_line, write_atomically
+
+_FEED_WORD = re.compile(r"(?:^|\s+)F[-+]?[0-9.]+", re.IGNORECASE)
+
+# Longest polyline planned at once; longer ones are planned in pieces that
+# start and end at rest
+MAX_RUN_SEGMENTS = 10_000
+
+
+def _with_feed(line, feed):
+    """Return line with its F word replaced by feed, or removed when None."""
+    code, separator, comment = line.partition(";")
+    code = _FEED_WORD.sub("", code.rstrip("\r\n")).rstrip()
+    if feed is not None:
+        code += f" F{feed:g}"
+    if separator:
+        return f"{code} ;{comment}"
+    return code + "\n"
+
+
+def _junction_speeds(segments, max_speeds, acceleration, junction_deviation):
+    """
+    Highest speed at the start of every segment and at the end of the last.
+
+    The speed at a corner follows the junction deviation model: the sharper
+    the turn, the slower the pen has to go through it, and never faster than
+    the cruise speed of either segment. The polyline starts and ends at
+    rest, and speeds are then lowered wherever the pen could not accelerate
+    or brake in time over the segment lengths.
+    """
+    count = len(segments)
+    speeds = [0.0] * (count + 1)
+    for index in range(1, count):
+        _, ux0, uy0 = segments[index - 1]
+        _, ux1, uy1 = segments[index]
+        max_speed = min(max_speeds[index - 1], max_speeds[index])
+        # Sine of half the corner angle: 1 straight on, 0 for a reversal
+        sin_half = math.sqrt(max(0.0, (1.0 + ux0 * ux1 + uy0 * uy1) / 2.0))
+        if sin_half >= 1.0 - 1e-9:
+            speeds[index] = max_speed
+        else:
+            speeds[index] = min(
+                max_speed,
+                math.sqrt(acceleration * junction_deviation * sin_half / (1.0 - sin_half)),
+            )
+
+    for index in range(count - 1, -1, -1):
+        reachable = math.sqrt(speeds[index + 1] ** 2 + 2 * acceleration * segments[index][0])
+        speeds[index] = min(speeds[index], reachable)
+    for index in range(count):
+        reachable = math.sqrt(speeds[index] ** 2 + 2 * acceleration * segments[index][0])
+        speeds[index + 1] = min(speeds[index + 1], reachable)
+    return speeds
+
+
+def _move_seconds(length, entry, exit, cruise, acceleration):
+    """
+    Time of one move with a trapezoidal speed profile.
+
+    The pen accelerates from the entry speed towards the cruise speed and
+    brakes to the exit speed; moves too short to reach the cruise speed
+    peak where both ramps meet.
+    """
+    if acceleration <= 0:
+        return length / cruise
+    ramps = (2 * cruise**2 - entry**2 - exit**2) / (2 * acceleration)
+    if ramps <= length:
+        return (2 * cruise - entry - exit) / acceleration + (length - ramps) / cruise
+    peak = math.sqrt((entry**2 + exit**2) / 2.0 + acceleration * length)
+    return (2 * peak - entry - exit) / acceleration
+
+
+def _run_minutes(segments, cruise_speeds, acceleration, junction_deviation):
+    """Estimated minutes to draw a polyline from rest to rest."""
+    speeds = _junction_speeds(segments, cruise_speeds, acceleration, junction_deviation)
+    seconds = 0.0
+    for index, (length, _, _) in enumerate(segments):
+        seconds += _move_seconds(
+            length, speeds[index], speeds[index + 1], cruise_speeds[index], acceleration
+        )
+    return seconds / 60.0
+
+
+def plan_feed_rates(
+    gcode_file,
+    feed_rate_max,
+    acceleration=500,
+    junction_deviation=0.02,
+    feed_step=100,
+    z_up=20,
+    z_down=0,
+    feed_rate_travel=6000,
+):
+    """
+    Give every draw move a feed rate from its length and corners, in place.
+
+    Consecutive pen-down moves are planned one polyline at a time. Each move
+    gets the top speed the machine can reach on it, given its length and the
+    corner speeds at both ends, capped at feed_rate_max and rounded down to
+    feed_step. A move is never slower than the feed rate the program gave
+    it, so the original rate acts as the floor for tight curves. F words are
+    only written where the feed rate changes.
+
+    The durations before and after planning are both estimated with the
+    same acceleration and corner speed model, so they can be compared.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        feed_rate_max (float): Highest draw feed rate in mm/min.
+        acceleration (float): Machine acceleration in mm/s^2.
+        junction_deviation (float): Corner tolerance of the junction
+            deviation model in mm; higher values allow faster corners.
+        feed_step (float): Feed rates are rounded down to a multiple of this,
+            in mm/min.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+
+    Returns:
+        dict: "segments" (number of planned moves), "duration_before" and
+            "duration_after" (estimated minutes at the original and the
+            planned feed rates). Draw moves are timed with acceleration,
+            other moves from their length and feed rate alone.
+    """
+    max_speed = feed_rate_max / 60.0
+    stats = {"segments": 0, "duration_before": 0.0, "duration_after": 0.0}
+
+    def plan(run):
+        """Yield the buffered lines of one polyline with planned feed rates."""
+        moves = [move for move in run if move[1] is not None]
+        segments = [segment for _, segment, _ in moves]
+        speeds = _junction_speeds(
+            segments, [max_speed] * len(segments), acceleration, junction_deviation
+        )
+        feeds = []
+        for index, (_, segment, floor) in enumerate(moves):
+            entry, exit = speeds[index], speeds[index + 1]
+            peak = math.sqrt((entry**2 + exit**2) / 2.0 + acceleration * segment[0])
+            feed = math.floor(min(peak, max_speed) * 60.0 / feed_step) * feed_step
+            feeds.append(max(feed, floor))
+
+        stats["segments"] += len(moves)
+        stats["duration_before"] += _run_minutes(
+            segments,
+            [floor / 60.0 for _, _, floor in moves],
+            acceleration,
+            junction_deviation,
+        )
+        stats["duration_after"] += _run_minutes(
+            segments, [feed / 60.0 for feed in feeds], acceleration, junction_deviation
+        )
+
+        feeds = iter(feeds)
+        for line, segment, _ in run:
+            yield line, None if segment is None else next(feeds)
+
+    def lines():
+        state = MachineState(z_up, z_down, feed_rate_travel)
+        output_feed = None
+        run = []
+
+        def flush():
+            nonlocal output_feed
+            for line, feed in plan(run):
+                if feed is not None and feed != output_feed:
+                    output_feed = feed
+                    yield _with_feed(line, feed)
+                elif feed is not None:
+                    yield _with_feed(line, None)
+                else:
+                    yield line
+            run.clear()
+
+        with open(gcode_file) as gcode:
+            for line in gcode:
+                words, _ = parse_line(line)
+                x, y, down = state.x, state.y, state.pen_down
+                duration = state.apply(line)
+
+                is_draw = (
+                    down
+                    and state.pen_down
+                    and state.motion == 1
+                    and state.feed
+                    and not state.relative
+                    and not state.inches
+                    and (state.x != x or state.y != y)
+                    and all(letter in "GXYF" for letter in words)
+                    and words.get("G", 1) == 1
+                )
+                if is_draw:
+                    length = math.hypot(state.x - x, state.y - y)
+                    segment = (length, (state.x - x) / length, (state.y - y) / length)
+                    run.append((line, segment, state.feed))
+                    if len(run) >= MAX_RUN_SEGMENTS:
+                        yield from flush()
+                    continue
+                if run and not words:
+                    # Comments and blank lines do not end a polyline
+                    run.append((line, None, None))
+                    continue
+
+                if run:
+                    yield from flush()
+                stats["duration_before"] += duration
+                stats["duration_after"] += duration
+                if "F" in words:
+                    output_feed = state.feed
+                elif duration and state.motion == 1 and state.feed != output_feed:
+                    # The move relied on a feed rate that planning replaced
+                    feed = state.feed / 25.4 if state.inches else state.feed
+                    line = _with_feed(line, feed)
+                    output_feed = state.feed
+                yield line
+
+            if run:
+                yield from flush()
+
+    write_atomically(gcode_file, lines())
+    return stats
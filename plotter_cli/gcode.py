@@ -0,0 +1,372 @@
+import os
+import re
+import tempfile
+
+import numpy as np
+
+# Bytes that may appear in a plain decimal number
+_NUMBER_BYTES = np.zeros(256, dtype=bool)
+_NUMBER_BYTES[list(b"0123456789.-+")] = True
+
+# Bytes that may end a word
+_SEPARATOR_BYTES = np.zeros(256, dtype=bool)
+_SEPARATOR_BYTES[list(b" \t\r\n;")] = True
+
+_COMMENT = re.compile(rb";[^\n]*")
+
+# Syntax left to the line by line interpreter: relative moves, inches and
+# parenthesis comments (lowercase words are checked separately)
+_UNSUPPORTED = (b"G91", b"G20", b"(")
+
+# Longest number read by the vectorized parser
+_WORD_WIDTH = 14
+
+# Decimal weight of each digit, indexed by exponent + _WORD_WIDTH
+_POWERS_OF_TEN = 10.0 ** np.arange(-_WORD_WIDTH, _WORD_WIDTH + 1)
+
+
+def parse_line(line):
+    """
+    Split a G-code line into its words and comment.
+
+    Parameters:
+        line (str): One line of G-code.
+
+    Returns:
+        tuple: (words, comment) where words maps each letter to its value,
+            e.g. {"G": 1.0, "X": 10.0}, and comment is the text after ";".
+    """
+    code, _, comment = line.partition(";")
+    words = {}
+    for word in code.split():
+        try:
+            words[word[0].upper()] = float(word[1:])
+        except ValueError:
+            continue
+    return words, comment.strip()
+
+
+def write_atomically(path, lines):
+    """Write lines to a temporary file next to path, then move it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(suffix=".gcode", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as output:
+            output.writelines(lines)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+class PenState:
+    """
+    Decide whether the pen touches the paper from the Z position.
+
+    The pen is down when Z is closer to z_down than to z_up, which also works
+    for machines where the pen goes down with increasing Z.
+    """
+
+    def __init__(self, z_up=20, z_down=0):
+        self.threshold = (z_up + z_down) / 2
+        self.down_is_low = z_down <= z_up
+
+    def is_down(self, z):
+        if self.down_is_low:
+            return z < self.threshold
+        return z > self.threshold
+
+
+class MachineState:
+    """
+    Modal state of the machine while a program runs.
+
+    Tracks the position, pen, feed rate, positioning mode and units, and
+    estimates the duration of every move from its length and feed rate.
+    Acceleration is ignored, so estimates are a lower bound.
+    """
+
+    __slots__ = (
+        "pen",
+        "x",
+        "y",
+        "z",
+        "feed",
+        "rapid_rate",
+        "motion",
+        "relative",
+        "inches",
+    )
+
+    def __init__(self, z_up=20, z_down=0, feed_rate_travel=6000):
+        self.pen = PenState(z_up, z_down)
+        self.x = 0.0
+        self.y = 0.0
+        self.z = z_up
+        self.feed = None
+        self.rapid_rate = feed_rate_travel
+        self.motion = 0
+        self.relative = False
+        self.inches = False
+
+    @property
+    def pen_down(self):
+        return self.pen.is_down(self.z)
+
+    def copy(self):
+        state = MachineState.__new__(MachineState)
+        for name in self.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def apply(self, line):
+        """
+        Run one line of G-code.
+
+        Parameters:
+            line (str): One line of G-code.
+
+        Returns:
+            float: Estimated duration of the line in minutes.
+        """
+        code = line.partition(";")[0]
+        target = {}
+        for word in code.split():
+            letter = word[0].upper()
+            try:
+                value = float(word[1:])
+            except ValueError:
+                continue
+            if letter == "G":
+                if value in (0, 1):
+                    self.motion = int(value)
+                elif value == 90:
+                    self.relative = False
+                elif value == 91:
+                    self.relative = True
+                elif value == 20:
+                    self.inches = True
+                elif value == 21:
+                    self.inches = False
+            elif letter == "F":
+                self.feed = value * (25.4 if self.inches else 1.0)
+            elif letter in "XYZ":
+                target[letter] = value * (25.4 if self.inches else 1.0)
+        if not target:
+            return 0.0
+
+        if self.relative:
+            x = self.x + target.get("X", 0.0)
+            y = self.y + target.get("Y", 0.0)
+            z = self.z + target.get("Z", 0.0)
+        else:
+            x = target.get("X", self.x)
+            y = target.get("Y", self.y)
+            z = target.get("Z", self.z)
+        distance = ((x - self.x) ** 2 + (y - self.y) ** 2 + (z - self.z) ** 2) ** 0.5
+        self.x, self.y, self.z = x, y, z
+
+        rate = self.feed if self.motion == 1 and self.feed else self.rapid_rate
+        return distance / rate if rate else 0.0
+
+
+class _Toolpath:
+    """Collect segments and pen lifts while tracking the modal machine state."""
+
+    def __init__(self, z_up, z_down):
+        self.state = MachineState(z_up, z_down)
+        self.draw = []
+        self.travel = []
+        self.lifts = []
+
+    @property
+    def simple(self):
+        return not self.state.relative and not self.state.inches
+
+    def take(self):
+        chunk = {
+            "draw": _stack(self.draw, 4),
+            "travel": _stack(self.travel, 4),
+            "lifts": _stack(self.lifts, 2),
+        }
+        self.draw, self.travel, self.lifts = [], [], []
+        return chunk
+
+    def add_lines(self, lines):
+        """Interpret lines one at a time; handles any word order."""
+        draw, travel, lifts = [], [], []
+        state = self.state
+        for line in lines:
+            x, y, down = state.x, state.y, state.pen_down
+            state.apply(line)
+            # The Z word of a line applies before its XY move
+            now_down = state.pen_down
+            if down and not now_down:
+                lifts.append((x, y))
+            if state.x != x or state.y != y:
+                (draw if now_down else travel).append((x, y, state.x, state.y))
+
+        for target, rows, width in (
+            (self.draw, draw, 4),
+            (self.travel, travel, 4),
+            (self.lifts, lifts, 2),
+        ):
+            if rows:
+                target.append(np.array(rows, dtype=np.float64).reshape(-1, width))
+
+    def add_columns(self, xs, ys, zs):
+        """Interpret per-line X, Y and Z words (NaN when absent) with NumPy."""
+        n = len(xs)
+        # Forward fill the modal positions, seeded with the current state
+        values = np.empty((3, n + 1))
+        state = self.state
+        values[:, 0] = (state.x, state.y, state.z)
+        values[0, 1:] = xs
+        values[1, 1:] = ys
+        values[2, 1:] = zs
+        index = np.where(np.isnan(values), 0, np.arange(n + 1))
+        np.maximum.accumulate(index, axis=1, out=index)
+        x, y, z = np.take_along_axis(values, index, axis=1)
+
+        if state.pen.down_is_low:
+            down = z < state.pen.threshold
+        else:
+            down = z > state.pen.threshold
+
+        # The Z word of a line applies before its XY move
+        moved = (x[1:] != x[:-1]) | (y[1:] != y[:-1])
+        segments = np.stack([x[:-1], y[:-1], x[1:], y[1:]], axis=1)
+        self.draw.append(segments[moved & down[1:]])
+        self.travel.append(segments[moved & ~down[1:]])
+        lifted = down[:-1] & ~down[1:]
+        self.lifts.append(np.stack([x[:-1][lifted], y[:-1][lifted]], axis=1))
+
+        state.x, state.y, state.z = float(x[-1]), float(y[-1]), float(z[-1])
+
+
+def _parse_numbers(buf, positions):
+    """
+    Parse the plain decimal numbers that follow each letter position in buf.
+
+    Returns None when a number is too long, empty or not a plain decimal
+    (e.g. uses an exponent), so the caller can fall back to float().
+    """
+    count = len(positions)
+    columns = np.arange(_WORD_WIDTH)
+    index = np.minimum(positions[:, None] + 1 + columns, len(buf) - 1)
+    chars = buf[index]
+    valid = np.cumprod(_NUMBER_BYTES[chars], axis=1).astype(bool)
+    length = valid.sum(axis=1)
+    if count and (length.max() >= _WORD_WIDTH or length.min() == 0):
+        return None
+    ends = positions + 1 + length
+    if not _SEPARATOR_BYTES[buf[np.minimum(ends, len(buf) - 1)]][ends < len(buf)].all():
+        return None
+
+    digits = chars.astype(np.int8) - 48
+    is_digit = valid & (digits >= 0)
+    dot = valid & (chars == ord("."))
+    dot_position = np.where(dot.any(axis=1), dot.argmax(axis=1), length)[:, None]
+    exponent = dot_position - columns - (columns < dot_position)
+    weights = _POWERS_OF_TEN[exponent + _WORD_WIDTH]
+    weights[~is_digit] = 0.0
+    values = np.einsum("ij,ij->i", digits, weights)
+    return np.where(chars[:, 0] == ord("-"), -values, values)
+
+
+def _stack(arrays, width):
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return np.empty((0, width))
+    return np.concatenate(arrays)
+
+
+def _parse_block(data):
+    """
+    Extract the X, Y and Z word of every line of a block of G-code bytes.
+
+    Returns:
+        tuple: (xs, ys, zs) float arrays with one entry per line and NaN where
+            the line has no such word, or None when the block needs the line
+            by line interpreter (relative moves, inches, lowercase words,
+            parenthesis comments or unusual numbers).
+    """
+    code = _COMMENT.sub(b"", data)
+    if code != code.upper() or any(token in code for token in _UNSUPPORTED):
+        return None
+    if not code.endswith(b"\n"):
+        # Numbers are read up to a separator, which the last line may lack
+        code += b"\n"
+    buf = np.frombuffer(code, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    lines = len(newlines)
+
+    words = []
+    for letter in b"XYZ":
+        positions = np.flatnonzero(buf == letter)
+        # Only letters that start a word count
+        before = buf[np.maximum(positions - 1, 0)]
+        positions = positions[_SEPARATOR_BYTES[before] | (positions == 0)]
+        values = _parse_numbers(buf, positions)
+        if values is None:
+            return None
+        column = np.full(lines, np.nan)
+        column[np.searchsorted(newlines, positions)] = values
+        words.append(column)
+    return tuple(words)
+
+
+def read_toolpath_chunks(gcode_file, z_up=20, z_down=0, chunk_lines=250_000):
+    """
+    Stream the XY moves of a G-code file in compact chunks.
+
+    Blocks of lines are tokenized and interpreted with NumPy, which keeps
+    multi-million line files fast. Blocks using G91 relative moves, G20 inch
+    units or unusual syntax go through a line by line interpreter instead,
+    with the same result, only slower. Arcs are not interpreted.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        chunk_lines (int): Number of lines read per chunk.
+
+    Yields:
+        dict: "draw" and "travel" arrays of x0, y0, x1, y1 segment rows, and
+            a "lifts" array of x, y rows where the pen was raised.
+    """
+    toolpath = _Toolpath(z_up, z_down)
+    with open(gcode_file, "rb") as gcode:
+        while True:
+            lines = gcode.readlines(chunk_lines * 32)
+            if not lines:
+                break
+            columns = _parse_block(b"".join(lines)) if toolpath.simple else None
+            if columns is not None:
+                toolpath.add_columns(*columns)
+            else:
+                toolpath.add_lines(line.decode() for line in lines)
+            yield toolpath.take()
+
+
+def toolpath_stats(gcode_file, z_up=20, z_down=0):
+    """
+    Measure the draw and travel distances and pen lifts of a G-code file.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+
+    Returns:
+        dict: Draw and travel distances in mm, and the number of pen lifts.
+    """
+    stats = {"draw_distance": 0.0, "travel_distance": 0.0, "pen_lifts": 0}
+    for chunk in read_toolpath_chunks(gcode_file, z_up, z_down):
+        for name in ("draw", "travel"):
+            seg = chunk[name]
+            if len(seg):
+                length = np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1])
+                stats[f"{name}_distance"] += float(length.sum())
+        stats["pen_lifts"] += len(chunk["lifts"])
+    return stats
@@ -0,0 +1,603 @@
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from array import array
+
+# Containers whose content is never drawn directly
+SKIPPED_TAGS = {
+    "defs",
+    "clipPath",
+    "mask",
+    "marker",
+    "pattern",
+    "symbol",
+    "metadata",
+    "style",
+    "title",
+    "desc",
+}
+
+# Elements that produce geometry; text, images and <use> references are not read
+DRAWABLE_TAGS = {"path", "line", "polyline", "polygon", "rect", "circle", "ellipse"}
+
+# Stroke used for elements that do not set or inherit one
+DEFAULT_STROKE = "black"
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+_NUMBER = r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(r"[MmZzLlHhVvCcSsQqTtAa]|" + _NUMBER)
+_NUMBER_TOKEN = re.compile(_NUMBER)
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _multiply(m, n):
+    """Compose two affine matrices (a, b, c, d, e, f); n is applied first."""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + c * b2,
+        b * a2 + d * b2,
+        a * c2 + c * d2,
+        b * c2 + d * d2,
+        a * e2 + c * f2 + e,
+        b * e2 + d * f2 + f,
+    )
+
+
+def parse_transform(value):
+    """
+    Parse an SVG transform attribute.
+
+    Parameters:
+        value (str): Content of the transform attribute.
+
+    Returns:
+        tuple: Affine matrix as (a, b, c, d, e, f).
+    """
+    matrix = IDENTITY
+    for name, args in _TRANSFORM.findall(value or ""):
+        v = [float(x) for x in _NUMBER_TOKEN.findall(args)]
+        if name == "matrix" and len(v) == 6:
+            step = tuple(v)
+        elif name == "translate" and v:
+            step = (1.0, 0.0, 0.0, 1.0, v[0], v[1] if len(v) > 1 else 0.0)
+        elif name == "scale" and v:
+            step = (v[0], 0.0, 0.0, v[1] if len(v) > 1 else v[0], 0.0, 0.0)
+        elif name == "rotate" and v:
+            angle = math.radians(v[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(v) == 3:
+                cx, cy = v[1], v[2]
+                step = _multiply(
+                    (1.0, 0.0, 0.0, 1.0, cx, cy),
+                    _multiply(step, (1.0, 0.0, 0.0, 1.0, -cx, -cy)),
+                )
+        elif name == "skewX" and v:
+            step = (1.0, 0.0, math.tan(math.radians(v[0])), 1.0, 0.0, 0.0)
+        elif name == "skewY" and v:
+            step = (1.0, math.tan(math.radians(v[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        matrix = _multiply(matrix, step)
+    return matrix
+
+
+def _style_value(element, name):
+    """Read a presentation attribute, letting the style attribute win."""
+    style = element.get("style")
+    if style:
+        for declaration in style.split(";"):
+            key, _, value = declaration.partition(":")
+            if key.strip() == name:
+                return value.strip()
+    return element.get(name)
+
+
+def _flatten_quadratic(p0, p1, p2, tolerance):
+    dd = abs(p0 - 2 * p1 + p2)
+    n = max(1, int(math.ceil(math.sqrt(dd / (4 * tolerance)))))
+    points = []
+    for i in range(1, n + 1):
+        t = i / n
+        mt = 1 - t
+        points.append(mt * mt * p0 + 2 * mt * t * p1 + t * t * p2)
+    return points
+
+
+def _flatten_cubic(p0, p1, p2, p3, tolerance):
+    dd = max(abs(p0 - 2 * p1 + p2), abs(p1 - 2 * p2 + p3))
+    n = max(1, int(math.ceil(math.sqrt(0.75 * dd / tolerance))))
+    points = []
+    for i in range(1, n + 1):
+        t = i / n
+        mt = 1 - t
+        points.append(
+            mt * mt * mt * p0
+            + 3 * mt * mt * t * p1
+            + 3 * mt * t * t * p2
+            + t * t * t * p3
+        )
+    return points
+
+
+def _arc_steps(radius, sweep, tolerance):
+    if radius <= tolerance:
+        return max(1, int(math.ceil(abs(sweep) / (math.pi / 2))))
+    step = 2 * math.acos(1 - tolerance / radius)
+    return max(1, int(math.ceil(abs(sweep) / step)))
+
+
+def _flatten_arc(p0, rx, ry, rotation, large_arc, sweep, p1, tolerance):
+    """Flatten an SVG elliptical arc, following the SVG implementation notes."""
+    if p0 == p1:
+        return []
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0:
+        return [p1]
+
+    phi = math.radians(rotation)
+    cos_phi, sin_phi = math.cos(phi), math.sin(phi)
+    half = (p0 - p1) / 2
+    x1 = cos_phi * half.real + sin_phi * half.imag
+    y1 = -sin_phi * half.real + cos_phi * half.imag
+
+    scale = (x1 * x1) / (rx * rx) + (y1 * y1) / (ry * ry)
+    if scale > 1:
+        rx *= math.sqrt(scale)
+        ry *= math.sqrt(scale)
+
+    num = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+    den = rx * rx * y1 * y1 + ry * ry * x1 * x1
+    factor = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if large_arc == sweep:
+        factor = -factor
+    cx1 = factor * rx * y1 / ry
+    cy1 = -factor * ry * x1 / rx
+
+    mid = (p0 + p1) / 2
+    center = complex(
+        cos_phi * cx1 - sin_phi * cy1 + mid.real,
+        sin_phi * cx1 + cos_phi * cy1 + mid.imag,
+    )
+
+    theta1 = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    theta2 = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx)
+    delta = theta2 - theta1
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+
+    n = _arc_steps(max(rx, ry), delta, tolerance)
+    points = []
+    for i in range(1, n):
+        theta = theta1 + delta * i / n
+        x = rx * math.cos(theta)
+        y = ry * math.sin(theta)
+        points.append(
+            center + complex(cos_phi * x - sin_phi * y, sin_phi * x + cos_phi * y)
+        )
+    points.append(p1)
+    return points
+
+
+def _ellipse(cx, cy, rx, ry, tolerance):
+    n = max(8, _arc_steps(max(rx, ry), 2 * math.pi, tolerance))
+    points = []
+    for i in range(n):
+        theta = 2 * math.pi * i / n
+        points.append(complex(cx + rx * math.cos(theta), cy + ry * math.sin(theta)))
+    points.append(points[0])
+    return points
+
+
+def parse_path(d, tolerance=0.1):
+    """
+    Flatten SVG path data into polylines.
+
+    Parameters:
+        d (str): Content of the path's d attribute.
+        tolerance (float): Maximum deviation of the flattened curves, in
+            user units.
+
+    Returns:
+        list: Polylines as lists of complex points.
+    """
+    tokens = _PATH_TOKEN.findall(d or "")
+    tokens.reverse()
+    polylines = []
+    current = []
+    position = start = 0j
+    last_control = None
+    command = None
+
+    def number():
+        return float(tokens.pop())
+
+    def flag():
+        # Arc flags may be written without separators ("a1 1 0 011 1")
+        token = tokens.pop()
+        if len(token) > 1:
+            tokens.append(token[1:])
+        return token[0] == "1"
+
+    while tokens:
+        if tokens[-1].isalpha():
+            command = tokens.pop()
+        elif command is None:
+            break
+        relative = command.islower()
+        upper = command.upper()
+        origin = position if relative else 0j
+        control = None
+
+        try:
+            if upper == "Z":
+                if current:
+                    if current[-1] != start:
+                        current.append(start)
+                    polylines.append(current)
+                    current = []
+                position = start
+                command = None
+                last_control = None
+                continue
+            if upper == "M":
+                if len(current) > 1:
+                    polylines.append(current)
+                position = start = origin + complex(number(), number())
+                current = [position]
+                # Implicit commands after a moveto are linetos
+                command = "l" if relative else "L"
+                last_control = None
+                continue
+
+            if not current:
+                current = [position]
+            if upper == "L":
+                position = origin + complex(number(), number())
+                current.append(position)
+            elif upper == "H":
+                x = number() + (position.real if relative else 0)
+                position = complex(x, position.imag)
+                current.append(position)
+            elif upper == "V":
+                y = number() + (position.imag if relative else 0)
+                position = complex(position.real, y)
+                current.append(position)
+            elif upper in ("C", "S"):
+                if upper == "C":
+                    c1 = origin + complex(number(), number())
+                elif last_control is not None and last_control[0] == "C":
+                    c1 = 2 * position - last_control[1]
+                else:
+                    c1 = position
+                c2 = origin + complex(number(), number())
+                end = origin + complex(number(), number())
+                current.extend(_flatten_cubic(position, c1, c2, end, tolerance))
+                control = ("C", c2)
+                position = end
+            elif upper in ("Q", "T"):
+                if upper == "Q":
+                    c1 = origin + complex(number(), number())
+                elif last_control is not None and last_control[0] == "Q":
+                    c1 = 2 * position - last_control[1]
+                else:
+                    c1 = position
+                end = origin + complex(number(), number())
+                current.extend(_flatten_quadratic(position, c1, end, tolerance))
+                control = ("Q", c1)
+                position = end
+            elif upper == "A":
+                rx, ry, rotation = number(), number(), number()
+                large_arc, sweep = flag(), flag()
+                end = origin + complex(number(), number())
+                current.extend(
+                    _flatten_arc(
+                        position, rx, ry, rotation, large_arc, sweep, end, tolerance
+                    )
+                )
+                position = end
+            else:
+                break
+        except (IndexError, ValueError):
+            # Truncated or malformed data: keep what was parsed so far
+            break
+        last_control = control
+
+    if len(current) > 1:
+        polylines.append(current)
+    return polylines
+
+
+def _float(element, name, default=0.0):
+    try:
+        return float(element.get(name, default))
+    except ValueError:
+        # Values with units such as "10px" keep their numeric part
+        match = _NUMBER_TOKEN.match(element.get(name).strip())
+        return float(match.group(0)) if match else default
+
+
+def element_polylines(element, tolerance=0.1):
+    """
+    Flatten a drawable SVG element into polylines, in its own user units.
+
+    Parameters:
+        element (Element): SVG shape element.
+        tolerance (float): Maximum deviation of flattened curves.
+
+    Returns:
+        list: Polylines as lists of complex points.
+    """
+    tag = _local_name(element.tag)
+    if tag == "path":
+        return parse_path(element.get("d"), tolerance)
+    if tag == "line":
+        return [
+            [
+                complex(_float(element, "x1"), _float(element, "y1")),
+                complex(_float(element, "x2"), _float(element, "y2")),
+            ]
+        ]
+    if tag in ("polyline", "polygon"):
+        values = [float(v) for v in _NUMBER_TOKEN.findall(element.get("points", ""))]
+        points = [complex(x, y) for x, y in zip(values[0::2], values[1::2])]
+        if tag == "polygon" and points:
+            points.append(points[0])
+        return [points] if len(points) > 1 else []
+    if tag == "rect":
+        x, y = _float(element, "x"), _float(element, "y")
+        w, h = _float(element, "width"), _float(element, "height")
+        if w <= 0 or h <= 0:
+            return []
+        corners = [complex(x, y), complex(x + w, y), complex(x + w, y + h)]
+        return [corners + [complex(x, y + h), complex(x, y)]]
+    if tag == "circle":
+        r = _float(element, "r")
+        if r <= 0:
+            return []
+        cx, cy = _float(element, "cx"), _float(element, "cy")
+        return [_ellipse(cx, cy, r, r, tolerance)]
+    if tag == "ellipse":
+        rx, ry = _float(element, "rx"), _float(element, "ry")
+        if rx <= 0 or ry <= 0:
+            return []
+        cx, cy = _float(element, "cx"), _float(element, "cy")
+        return [_ellipse(cx, cy, rx, ry, tolerance)]
+    return []
+
+
+class SpillLayer:
+    """
+    Polylines of one stroke colour, spilled to disk in array-backed files.
+
+    Each layer owns two files: ``.idx`` holds the point count of every
+    polyline as unsigned 32-bit integers and ``.xy`` holds the interleaved
+    x, y coordinates as 32-bit floats. Polylines are buffered in memory
+    until the ingest flushes them. vpype reads the files directly with the
+    ``readspill`` command of the plugin.
+    """
+
+    def __init__(self, stroke, base_path):
+        self.stroke = stroke
+        self.base_path = base_path
+        self.index_path = base_path + ".idx"
+        self.coords_path = base_path + ".xy"
+        self.counts = array("I")
+        self.coords = array("f")
+        self.paths = 0
+        self.vertices = 0
+        open(self.index_path, "wb").close()
+        open(self.coords_path, "wb").close()
+
+    @property
+    def buffered_bytes(self):
+        return (
+            len(self.counts) * self.counts.itemsize
+            + len(self.coords) * self.coords.itemsize
+        )
+
+    def append(self, xs, ys):
+        interleaved = [0.0] * (2 * len(xs))
+        interleaved[0::2] = xs
+        interleaved[1::2] = ys
+        self.counts.append(len(xs))
+        self.coords.extend(interleaved)
+        self.paths += 1
+        self.vertices += len(xs)
+
+    def flush(self):
+        if not self.counts:
+            return
+        with open(self.index_path, "ab") as index_file:
+            self.counts.tofile(index_file)
+        with open(self.coords_path, "ab") as coords_file:
+            self.coords.tofile(coords_file)
+        self.counts = array("I")
+        self.coords = array("f")
+
+    def iter_polylines(self, chunk_paths=4096):
+        """Stream the spilled polylines back as lists of (x, y) tuples."""
+        self.flush()
+        with open(self.index_path, "rb") as index_file, open(
+            self.coords_path, "rb"
+        ) as coords_file:
+            while True:
+                counts = array("I")
+                try:
+                    counts.fromfile(index_file, chunk_paths)
+                except EOFError:
+                    pass
+                if not counts:
+                    return
+                coords = array("f")
+                coords.fromfile(coords_file, 2 * sum(counts))
+                offset = 0
+                for count in counts:
+                    end = offset + 2 * count
+                    xs = coords[offset:end:2]
+                    ys = coords[offset + 1 : end : 2]
+                    yield list(zip(xs, ys))
+                    offset = end
+
+    def remove(self):
+        for path in (self.index_path, self.coords_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+class IngestResult:
+    """Layers and geometry bounds produced by a streaming ingest."""
+
+    def __init__(self, layers, bounds):
+        self.layers = layers
+        self.bounds = bounds
+
+    @property
+    def paths(self):
+        return sum(layer.paths for layer in self.layers)
+
+    @property
+    def vertices(self):
+        return sum(layer.vertices for layer in self.layers)
+
+
+def iter_drawables(svg_file):
+    """
+    Walk an SVG with iterparse, yielding drawable elements as they complete.
+
+    Elements are cleared and detached from their parent once yielded, so
+    memory does not grow with the size of the document, however deeply its
+    groups are nested. Stroke colours and transforms are inherited from parent
+    groups; content of defs-like containers and hidden subtrees is skipped.
+
+    Parameters:
+        svg_file (str): Path to the SVG file.
+
+    Yields:
+        tuple: (element, stroke, matrix) for every drawable element.
+    """
+    stack = []
+    for event, element in ET.iterparse(svg_file, events=("start", "end")):
+        if event == "start":
+            parent_stroke, parent_matrix, parent_skip = (
+                stack[-1][1:] if stack else (DEFAULT_STROKE, IDENTITY, False)
+            )
+            tag = _local_name(element.tag)
+            stroke = _style_value(element, "stroke")
+            if not stroke or stroke in ("inherit", "none"):
+                stroke = parent_stroke
+            transform = element.get("transform")
+            matrix = (
+                _multiply(parent_matrix, parse_transform(transform))
+                if transform
+                else parent_matrix
+            )
+            skip = (
+                parent_skip
+                or tag in SKIPPED_TAGS
+                or _style_value(element, "display") == "none"
+            )
+            stack.append((element, stroke.strip().lower(), matrix, skip))
+            continue
+
+        _, stroke, matrix, skip = stack.pop()
+        if not skip and _local_name(element.tag) in DRAWABLE_TAGS:
+            yield element, stroke, matrix
+        element.clear()
+        if stack:
+            # Detach the finished element so no open ancestor keeps it
+            stack[-1][0].remove(element)
+
+
+def ingest_svg(svg_file, spill_dir, tolerance=0.1, memory_budget=256 * 1024 * 1024):
+    """
+    Stream an SVG into per-stroke spill files with bounded memory.
+
+    Paths are flattened and bucketed by stroke colour into one
+    ``SpillLayer`` per colour. Buffered polylines are flushed to disk
+    whenever they exceed the memory budget, so peak memory does not depend
+    on the size of the input.
+
+    Parameters:
+        svg_file (str): Path to the SVG file.
+        spill_dir (str): Directory receiving the spill files.
+        tolerance (float): Curve flattening tolerance, in SVG user units.
+        memory_budget (int): Maximum number of bytes of buffered geometry.
+
+    Returns:
+        IngestResult: Spilled layers, in order of first appearance, and the
+            (min_x, min_y, max_x, max_y) bounds of the geometry.
+    """
+    layers = {}
+    buffered = 0
+    min_x = min_y = math.inf
+    max_x = max_y = -math.inf
+
+    for element, stroke, matrix in iter_drawables(svg_file):
+        polylines = element_polylines(element, tolerance)
+        if not polylines:
+            continue
+        layer = layers.get(stroke)
+        if layer is None:
+            layer = SpillLayer(
+                stroke, os.path.join(spill_dir, f"layer_{len(layers) + 1}")
+            )
+            layers[stroke] = layer
+
+        a, b, c, d, e, f = matrix
+        for points in polylines:
+            xs = [a * p.real + c * p.imag + e for p in points]
+            ys = [b * p.real + d * p.imag + f for p in points]
+            min_x, max_x = min(min_x, min(xs)), max(max_x, max(xs))
+            min_y, max_y = min(min_y, min(ys)), max(max_y, max(ys))
+            layer.append(xs, ys)
+            buffered += 4 + 8 * len(xs)
+
+        if buffered > memory_budget:
+            for spilled in layers.values():
+                spilled.flush()
+            buffered = 0
+
+    for layer in layers.values():
+        layer.flush()
+
+    bounds = (min_x, min_y, max_x, max_y) if layers else None
+    return IngestResult(list(layers.values()), bounds)
+
+
+def page_transform(bounds, target_width, target_height, page_width, page_height):
+    """
+    Scale and offset that fit the document bounds to a target size on a page.
+
+    The transform matches ``scaleto`` followed by ``layout``: the document
+    bounds are scaled to fit the target size, keeping the aspect ratio, and
+    centered on the page. Every layer shares the same transform so layers
+    stay registered with each other.
+
+    Parameters:
+        bounds (tuple): (min_x, min_y, max_x, max_y) of the whole document.
+        target_width (float): Width to scale the document to, in mm.
+        target_height (float): Height to scale the document to, in mm.
+        page_width (float): Page width in mm.
+        page_height (float): Page height in mm.
+
+    Returns:
+        tuple: (scale, offset_x, offset_y) mapping a point (x, y) of the
+            document to (x * scale + offset_x, y * scale + offset_y) in mm.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    width = max(max_x - min_x, 1e-9)
+    height = max(max_y - min_y, 1e-9)
+    scale = min(target_width / width, target_height / height)
+    offset_x = page_width / 2 - (min_x + max_x) / 2 * scale
+    offset_y = page_height / 2 - (min_y + max_y) / 2 * scale
+    return scale, offset_x, offset_y
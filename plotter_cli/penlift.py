@@ -0,0 +1,178 @@
+from .dedupe import SegmentGrid, _uncovered
+from .gcode import MachineState, parse_line, write_atomically
+
+# G codes a pen-up gap may contain and still be replaced by a pen-down move
+_GAP_G_CODES = (0, 1, 21, 90)
+
+# Pen-up sequences longer than this are never joined
+MAX_GAP_LINES = 32
+
+
+def _gap_line(words):
+    """Return True when a line may be dropped from a joined gap."""
+    if any(letter not in "GXYZF" for letter in words):
+        return False
+    return words.get("G", 0) in _GAP_G_CODES
+
+
+class _InkedLines:
+    """
+    Spatial index of the most recently drawn segments.
+
+    Segments go into a SegmentGrid until it holds window of them; the grid
+    is then kept as the previous generation and a new one is started,
+    dropping the generation before. Between window and twice window of the
+    latest segments are indexed, so memory does not grow with the program.
+    """
+
+    def __init__(self, cell_size, tolerance, window):
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self.window = window
+        self.grids = [SegmentGrid(cell_size, tolerance)]
+
+    def __len__(self):
+        return sum(len(grid) for grid in self.grids)
+
+    def add(self, a, b):
+        if len(self.grids[-1]) >= self.window:
+            self.grids = [self.grids[-1], SegmentGrid(self.cell_size, self.tolerance)]
+        self.grids[-1].add(a, b)
+
+    def covers(self, a, b):
+        """Return True when segment a-b only retraces indexed segments."""
+        length = abs(b - a)
+        if length == 0:
+            return False
+        intervals = [
+            interval for grid in self.grids for interval in grid.covered_intervals(a, b)
+        ]
+        return not _uncovered(intervals, self.tolerance / length)
+
+
+def join_short_gaps(
+    gcode_file,
+    max_gap,
+    z_up=20,
+    z_down=0,
+    feed_rate_draw=3000,
+    feed_rate_travel=6000,
+    inked_tolerance=0.05,
+    cell_size=10.0,
+    inked_window=100_000,
+):
+    """
+    Replace short pen-up travels between polylines with pen-down moves, in place.
+
+    Every time the pen is lifted, the lines up to the next pen-down are
+    buffered. When they only raise the pen, travel and lower it again, and
+    the travel is at most max_gap long or only retraces recently drawn lines,
+    they are replaced by one draw move to the next polyline. Gaps containing
+    any other command (pauses, tool changes, unit or positioning changes)
+    are kept as they are.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        max_gap (float): Longest travel to draw over, in mm.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        feed_rate_draw (int): Feed rate of the joining moves when the
+            program has not set one, in mm/min.
+        feed_rate_travel (int): Feed rate of G0 moves in mm/min.
+        inked_tolerance (float): Distance within which a travel counts as
+            retracing drawn lines, in mm; None only joins short gaps.
+        cell_size (float): Size of the spatial hash cells of drawn lines.
+        inked_window (int): Number of latest draw moves a travel may retrace;
+            older ones are dropped from the index to bound its memory.
+
+    Returns:
+        dict: "lifts_saved" (number of joined gaps) and "time_saved"
+            (estimated minutes saved).
+    """
+    stats = {"lifts_saved": 0, "time_saved": 0.0}
+    grid = (
+        _InkedLines(cell_size, inked_tolerance, inked_window)
+        if inked_tolerance
+        else None
+    )
+
+    def lines():
+        state = MachineState(z_up, z_down, feed_rate_travel)
+        draw_feed = None
+        restore_feed = None
+        gap = None
+        gap_start = gap_z = None
+        gap_time = 0.0
+
+        with open(gcode_file) as gcode:
+            for line in gcode:
+                words, _ = parse_line(line)
+                x, y, z, down = state.x, state.y, state.z, state.pen_down
+                duration = state.apply(line)
+                moved = state.x != x or state.y != y
+
+                # The feed rate changed by a join is restored before the
+                # next move that relies on it
+                if restore_feed is not None and gap is None:
+                    if "F" in words:
+                        restore_feed = None
+                    elif moved or "Z" in words:
+                        yield f"F{restore_feed:g} ; Restore feed rate\n"
+                        restore_feed = None
+
+                if gap is not None:
+                    gap.append(line)
+                    gap_time += duration
+                    if state.pen_down:
+                        start = complex(*gap_start)
+                        end = complex(state.x, state.y)
+                        joinable = (
+                            not moved
+                            and state.z == gap_z
+                            and state.motion == 1
+                            and not state.relative
+                            and not state.inches
+                            and _gap_line(words)
+                        )
+                        if joinable and (
+                            abs(end - start) <= max_gap
+                            or (grid is not None and grid.covers(start, end))
+                        ):
+                            feed = draw_feed or feed_rate_draw
+                            yield (
+                                f"G1 X{state.x:.4f} Y{state.y:.4f} F{feed:g}"
+                                " ; Pen-down join\n"
+                            )
+                            if grid is not None and end != start:
+                                grid.add(start, end)
+                            if state.feed is not None and state.feed != feed:
+                                restore_feed = state.feed
+                            stats["lifts_saved"] += 1
+                            stats["time_saved"] += gap_time - abs(end - start) / feed
+                        else:
+                            yield from gap
+                        gap = None
+                    elif len(gap) > MAX_GAP_LINES or not _gap_line(words):
+                        yield from gap
+                        gap = None
+                    continue
+
+                if down and not state.pen_down and not moved and _gap_line(words):
+                    # The pen is lifted: hold the lines until it goes down
+                    gap = [line]
+                    gap_start = (x, y)
+                    gap_z = z
+                    gap_time = duration
+                    continue
+
+                yield line
+                if down and state.pen_down and moved:
+                    draw_feed = state.feed
+                    if grid is not None:
+                        grid.add(complex(x, y), complex(state.x, state.y))
+
+            if gap is not None:
+                yield from gap
+
+    write_atomically(gcode_file, lines())
+    return stats
@@ -0,0 +1,411 @@
+import json
+import math
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .ingest import element_polylines, iter_drawables
+from .utils import get_svg_dimensions
+
+DEFAULT_COST_MODEL_PATH = os.path.join(
+    os.path.expanduser("~"), ".plotter_cli", "cost_model.json"
+)
+
+# Two-opt pass counts tried by choose_plan, most thorough first
+PASS_CHOICES = (2000, 500, 100, 20, 0)
+
+# Below this many paths per layer the greedy sort is as good as two-opt
+MIN_TWO_OPT_PATHS = 3
+
+# Tolerance of linesimplify in mm, used when segments are much shorter than
+# what a pen can render
+SIMPLIFY_TOLERANCE = 0.05
+
+# Approximate bytes vpype holds per vertex and per path while optimizing
+BYTES_PER_VERTEX = 48
+BYTES_PER_PATH = 600
+
+
+@dataclass
+class LayerProfile:
+    paths: int = 0
+    vertices: int = 0
+    length: float = 0.0
+
+
+@dataclass
+class SvgProfile:
+    """Geometry counts of an SVG, gathered by a streaming scan."""
+
+    svg_file: str
+    width: float
+    height: float
+    file_size: int
+    layers: Dict[str, LayerProfile] = field(default_factory=dict)
+    scan_seconds: float = 0.0
+
+    @property
+    def paths(self):
+        return sum(layer.paths for layer in self.layers.values())
+
+    @property
+    def vertices(self):
+        return sum(layer.vertices for layer in self.layers.values())
+
+    @property
+    def length(self):
+        return sum(layer.length for layer in self.layers.values())
+
+    @property
+    def counts(self):
+        """(paths, vertices, length) of every layer, as used by the cost model."""
+        return [
+            (layer.paths, layer.vertices, layer.length)
+            for layer in self.layers.values()
+        ]
+
+
+def scan_svg(svg_file, width, tolerance=0.1):
+    """
+    Count the paths, vertices and drawing length of every stroke colour.
+
+    The SVG is read with the same streaming walk as the bounded-memory
+    ingest, so the scan is fast and its memory use does not depend on the
+    size of the file.
+
+    Parameters:
+        svg_file (str): Path to the SVG file.
+        width (float): Width the drawing is scaled to, in mm.
+        tolerance (float): Curve flattening tolerance, in SVG user units.
+
+    Returns:
+        SvgProfile: Per-layer counts, with lengths in mm at that width.
+    """
+    started = time.perf_counter()
+    svg_width, svg_height = get_svg_dimensions(svg_file)
+    # Lengths feed the cost model, so they must not depend on the SVG's units
+    mm = width / svg_width if svg_width else 1.0
+    layers = {}
+    for element, stroke, matrix in iter_drawables(svg_file):
+        a, b, c, d, _, _ = matrix
+        scale = mm * math.sqrt(abs(a * d - b * c))
+        layer = layers.get(stroke)
+        if layer is None:
+            layer = layers[stroke] = LayerProfile()
+        for points in element_polylines(element, tolerance):
+            layer.paths += 1
+            layer.vertices += len(points)
+            layer.length += scale * sum(
+                abs(q - p) for p, q in zip(points[:-1], points[1:])
+            )
+
+    return SvgProfile(
+        svg_file,
+        svg_width,
+        svg_height,
+        os.path.getsize(svg_file),
+        {stroke: layer for stroke, layer in layers.items() if layer.paths},
+        time.perf_counter() - started,
+    )
+
+
+def fit_to_area(svg_width, svg_height, area_width, area_height):
+    """Return the largest (width, height) with the SVG's ratio fitting the area."""
+    scale = min(area_width / svg_width, area_height / svg_height)
+    return svg_width * scale, svg_height * scale
+
+
+def _time_features(layers, passes):
+    """Features of one vpype run over (paths, vertices, length) layers."""
+    paths = sum(layer[0] for layer in layers)
+    vertices = sum(layer[1] for layer in layers)
+    length = sum(layer[2] for layer in layers)
+    # Each two-opt pass walks every path of a layer and compares it with the
+    # rest of that layer
+    squares = sum(layer[0] * layer[0] for layer in layers)
+    return [1.0, vertices, paths, length, paths * passes, squares * passes]
+
+
+def _size_features(layers):
+    return [
+        1.0,
+        sum(layer[1] for layer in layers),
+        sum(layer[0] for layer in layers),
+        sum(layer[2] for layer in layers),
+    ]
+
+
+# Fewer benchmark runs than features leave the fit underdetermined
+MIN_SAMPLES = max(len(_time_features([], 0)), len(_size_features([])))
+# Runs of one file share every feature but the two-opt ones, so the constant,
+# vertex, path and length terms can only be told apart across distinct files
+MIN_FILES = len(_size_features([]))
+
+
+def _rank(rows):
+    """Rank of a feature matrix, with every column scaled to the same range."""
+    x = np.asarray(rows, dtype=np.float64)
+    return int(np.linalg.matrix_rank(x / np.maximum(np.abs(x).max(axis=0), 1e-300)))
+
+
+def _fit_nonnegative(rows, targets):
+    """
+    Least squares fit with non-negative coefficients, on relative errors.
+
+    Coefficients that come out negative are dropped one at a time and the
+    fit is repeated, which is enough for the handful of features used here.
+    """
+    x = np.asarray(rows, dtype=np.float64)
+    y = np.asarray(targets, dtype=np.float64)
+    weights = 1.0 / np.maximum(y, 1e-9)
+    x = x * weights[:, None]
+    y = y * weights
+    scale = np.maximum(np.abs(x).max(axis=0), 1e-300)
+    active = list(range(x.shape[1]))
+    coefficients = np.zeros(x.shape[1])
+    while active:
+        solution = np.linalg.lstsq(x[:, active] / scale[active], y, rcond=None)[0]
+        solution /= scale[active]
+        if (solution >= 0).all():
+            coefficients[active] = solution
+            break
+        del active[int(np.argmin(solution))]
+    return coefficients.tolist()
+
+
+@dataclass
+class CostModel:
+    """
+    Predicts vpype processing time and G-code size from geometry counts.
+
+    Time is modelled as a startup cost, a cost per vertex, per path and per
+    unit of drawing length (vpype cuts curves into short segments when it
+    reads them), and a two-opt cost growing with the number of passes and
+    the square of the number of paths in each layer. Size uses the same
+    vertex, path and length terms.
+    The defaults are rough figures for a typical laptop; calibrating with a
+    benchmark corpus replaces them with measurements from this machine.
+    """
+
+    time_coefficients: List[float] = field(
+        default_factory=lambda: [1.5, 2e-6, 5e-5, 0.0, 1e-5, 2e-8]
+    )
+    size_coefficients: List[float] = field(
+        default_factory=lambda: [2000.0, 38.0, 160.0, 0.0]
+    )
+    samples: int = 0
+
+    @property
+    def calibrated(self):
+        return self.samples > 0
+
+    def predict_seconds(self, layers, passes):
+        """Predict the time of one vpype run over (paths, vertices, length) layers."""
+        features = _time_features(layers, passes)
+        return float(np.dot(self.time_coefficients, features))
+
+    def predict_bytes(self, layers):
+        """Predict the G-code size of (paths, vertices, length) layers."""
+        features = _size_features(layers)
+        return float(np.dot(self.size_coefficients, features))
+
+    @classmethod
+    def fit(cls, samples):
+        """
+        Fit a model to benchmark runs.
+
+        Parameters:
+            samples (list): Dicts with the "layers" ((paths, vertices,
+                length) tuples) and "passes" of a run, and its measured "seconds" and
+                "bytes".
+
+        Returns:
+            CostModel: The fitted model.
+
+        Raises:
+            ValueError: If there are fewer samples than MIN_SAMPLES, or the
+                samples do not vary enough to tell every feature apart.
+        """
+        if len(samples) < MIN_SAMPLES:
+            raise ValueError(
+                f"At least {MIN_SAMPLES} benchmark runs are needed to fit the "
+                f"cost model, got {len(samples)}"
+            )
+        time_rows = [_time_features(s["layers"], s["passes"]) for s in samples]
+        size_rows = [_size_features(s["layers"]) for s in samples]
+        for rows in (time_rows, size_rows):
+            if _rank(rows) < len(rows[0]):
+                raise ValueError(
+                    "The benchmark runs cannot tell the cost model features "
+                    f"apart: benchmark at least {MIN_FILES} files of different "
+                    "sizes and shapes with more than one pass count"
+                )
+        return cls(
+            _fit_nonnegative(time_rows, [s["seconds"] for s in samples]),
+            _fit_nonnegative(size_rows, [s["bytes"] for s in samples]),
+            len(samples),
+        )
+
+    def save(self, path=DEFAULT_COST_MODEL_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(asdict(self), file, indent=2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_COST_MODEL_PATH):
+        """Load a calibrated model, or the default model when there is none."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as file:
+            model = cls(**json.load(file))
+        # Models fitted with other features are ignored, not misread
+        default = cls()
+        if len(model.time_coefficients) != len(default.time_coefficients) or len(
+            model.size_coefficients
+        ) != len(default.size_coefficients):
+            return default
+        return model
+
+
+@dataclass
+class PipelinePlan:
+    """Processing settings picked from a pre-flight scan."""
+
+    passes: int
+    simplify_tolerance: Optional[float]
+    stream: bool
+    workers: int
+    predicted_seconds: float
+    predicted_bytes: float
+    reasons: List[str] = field(default_factory=list)
+
+
+def predict_seconds(profile, model, passes, stream=False, workers=1):
+    """
+    Predict the wall time of the vpype stage for a plan.
+
+    Without streaming, one vpype run handles every layer. With streaming,
+    each layer is a separate run and up to workers of them run at once.
+    """
+    layers = profile.counts
+    if not stream or not layers:
+        return model.predict_seconds(layers, passes)
+    times = [model.predict_seconds([layer], passes) for layer in layers]
+    return max(max(times), sum(times) / max(workers, 1))
+
+
+def choose_plan(
+    profile,
+    model,
+    time_budget=120,
+    memory_budget=256 * 1024 * 1024,
+    cpu_count=None,
+):
+    """
+    Pick optimizer passes, simplification, streaming and workers for a file.
+
+    The most thorough two-opt setting whose predicted time fits the budget
+    is kept. Multi-layer files whose geometry would not fit in memory are
+    streamed, and streamed files process as many layers in parallel as the
+    CPUs and the memory budget allow. Streaming is also used to bring a slow
+    multi-layer file within the time budget. Streaming cannot shrink a
+    single layer, so drawings with a layer larger than the memory budget
+    are simplified instead, as are very dense drawings.
+
+    Parameters:
+        profile (SvgProfile): Result of scan_svg, with lengths in mm.
+        model (CostModel): Cost model used for the predictions.
+        time_budget (float): Acceptable vpype time in seconds.
+        memory_budget (int): Bytes of geometry vpype may hold at once.
+        cpu_count (int): Number of CPUs; detected when None.
+
+    Returns:
+        PipelinePlan: The chosen settings and their predictions.
+    """
+    reasons = []
+    layers = list(profile.layers.values())
+    cpu_count = cpu_count or os.cpu_count() or 1
+
+    layer_memory = sorted(
+        (BYTES_PER_VERTEX * layer.vertices + BYTES_PER_PATH * layer.paths)
+        for layer in layers
+    )[::-1]
+    memory = sum(layer_memory)
+    largest = layer_memory[0] if layer_memory else 0
+    # Streaming holds one layer at a time, which only helps with several
+    must_stream = len(layers) > 1 and memory > memory_budget
+    # Parallel layers must fit in memory together, the largest ones included
+    parallel = 1
+    while (
+        parallel < min(cpu_count, len(layers))
+        and sum(layer_memory[: parallel + 1]) <= memory_budget
+    ):
+        parallel += 1
+    if must_stream:
+        reasons.append(
+            f"geometry needs about {memory / 2**20:.0f}MB, more than the "
+            f"{memory_budget / 2**20:.0f}MB budget: streaming"
+        )
+
+    simplify_tolerance = None
+    segments = profile.vertices - profile.paths
+    if largest > memory_budget:
+        simplify_tolerance = SIMPLIFY_TOLERANCE
+        reasons.append(
+            f"the largest layer alone needs about {largest / 2**20:.0f}MB, more "
+            f"than the {memory_budget / 2**20:.0f}MB budget, which streaming "
+            f"cannot fix: simplifying to {SIMPLIFY_TOLERANCE}mm"
+        )
+    elif segments > 0:
+        mean_segment = profile.length / segments
+        if mean_segment < 2 * SIMPLIFY_TOLERANCE:
+            simplify_tolerance = SIMPLIFY_TOLERANCE
+            reasons.append(
+                f"mean segment is {mean_segment:.3f}mm: simplifying to "
+                f"{SIMPLIFY_TOLERANCE}mm"
+            )
+
+    busiest = max((layer.paths for layer in layers), default=0)
+    choices = PASS_CHOICES if busiest >= MIN_TWO_OPT_PATHS else (0,)
+    if busiest < MIN_TWO_OPT_PATHS:
+        reasons.append("too few paths for two-opt to help: skipped")
+
+    options = [(True, parallel)] if must_stream else [(False, 1)]
+    if not must_stream and parallel > 1:
+        options.append((True, parallel))
+
+    plan = None
+    for passes in choices:
+        for stream, workers in options:
+            seconds = predict_seconds(profile, model, passes, stream, workers)
+            if seconds <= time_budget:
+                plan = (passes, stream, workers, seconds)
+                break
+        if plan:
+            break
+    if plan is None:
+        stream, workers = options[-1]
+        plan = (0, stream, workers, predict_seconds(profile, model, 0, stream, workers))
+        reasons.append(
+            f"predicted time exceeds the {time_budget:g}s budget even without two-opt"
+        )
+    elif plan[0] != choices[0]:
+        reasons.append(f"two-opt limited to {plan[0]} passes to fit the time budget")
+
+    passes, stream, workers, seconds = plan
+    if stream and not must_stream:
+        reasons.append("streaming so layers run in parallel")
+    if stream and workers > 1:
+        reasons.append(f"{workers} layers processed at once")
+    return PipelinePlan(
+        passes,
+        simplify_tolerance,
+        stream,
+        workers,
+        seconds,
+        model.predict_bytes(profile.counts),
+        reasons,
+    )
@@ -0,0 +1,185 @@
+import struct
+import zlib
+
+import numpy as np
+
+from .gcode import read_toolpath_chunks
+
+BACKGROUND = (255, 255, 255)
+DRAW_COLOR = (20, 40, 120)
+TRAVEL_COLOR = (240, 120, 110)
+CONTEXT_COLOR = (200, 200, 200)
+
+# Maximum number of raster samples generated at once
+SAMPLE_BATCH = 4_000_000
+
+
+def write_png(png_path, image):
+    """
+    Write an RGB image as a PNG file, without any imaging library.
+
+    Parameters:
+        png_path (str): Destination file.
+        image (ndarray): uint8 array of shape (height, width, 3).
+    """
+    height, width, _ = image.shape
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # No filter on any row
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        body = kind + data
+        return (
+            struct.pack(">I", len(data))
+            + body
+            + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+        )
+
+    with open(png_path, "wb") as png:
+        png.write(b"\x89PNG\r\n\x1a\n")
+        header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        png.write(chunk(b"IHDR", header))
+        png.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        png.write(chunk(b"IEND", b""))
+
+
+def _rasterize(counts, segments, scale, height):
+    """Accumulate the pixel coverage of x0, y0, x1, y1 segment rows into counts."""
+    if len(segments) == 0:
+        return
+    rows, cols = counts.shape
+    seg = segments * scale
+    # Machine Y points up, image rows point down
+    seg[:, 1] = height - seg[:, 1]
+    seg[:, 3] = height - seg[:, 3]
+    dx = seg[:, 2] - seg[:, 0]
+    dy = seg[:, 3] - seg[:, 1]
+    # One sample per pixel along the longest axis of each segment
+    samples = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    samples = np.minimum(samples, 2 * (rows + cols))
+
+    ends = np.cumsum(samples)
+    start = 0
+    while start < len(samples):
+        base = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, base + SAMPLE_BATCH, side="right"))
+        stop = max(stop, start + 1)
+        n = samples[start:stop]
+        index = np.repeat(np.arange(start, stop), n)
+        offsets = np.arange(len(index)) - np.repeat(ends[start:stop] - n - base, n)
+        t = offsets / np.maximum(n - 1, 1)[index - start]
+
+        px = (seg[index, 0] + dx[index] * t).astype(np.int64)
+        py = (seg[index, 1] + dy[index] * t).astype(np.int64)
+        inside = (px >= 0) & (px < cols) & (py >= 0) & (py < rows)
+        flat = py[inside] * cols + px[inside]
+        counts += np.bincount(flat, minlength=rows * cols).reshape(rows, cols)
+        start = stop
+
+
+def _box_blur(values, radius):
+    """Blur a 2D array with a separable box filter of the given radius."""
+    if radius < 1:
+        return values
+    size = 2 * radius + 1
+    for axis in (0, 1):
+        pad = [(radius + 1, radius) if a == axis else (0, 0) for a in (0, 1)]
+        padded = np.pad(values, pad)
+        summed = np.cumsum(padded, axis=axis)
+        if axis == 0:
+            values = (summed[size:] - summed[:-size]) / size
+        else:
+            values = (summed[:, size:] - summed[:, :-size]) / size
+    return values
+
+
+def _heat_colors(values):
+    """Map values in [0, 1] to a white, yellow, red, dark red ramp."""
+    stops = [0.0, 0.3, 0.65, 1.0]
+    channels = [
+        [255, 255, 230, 120],
+        [255, 220, 60, 0],
+        [255, 80, 20, 0],
+    ]
+    return np.stack(
+        [np.interp(values, stops, c) for c in channels], axis=-1
+    ).astype(np.uint8)
+
+
+def render_preview(
+    gcode_file,
+    png_path,
+    heatmap_path,
+    area_width,
+    area_height,
+    resolution=2.0,
+    z_up=20,
+    z_down=0,
+    blur=5.0,
+):
+    """
+    Render the toolpath of a G-code file and a heat map of its pen lifts.
+
+    The file is streamed in chunks and every chunk is rasterized with NumPy,
+    so memory use stays flat and no GUI toolkit is needed. Draw moves are
+    painted over travel moves. The heat map shows where the pen is raised,
+    blurred and normalized, with the drawing in light grey where there are
+    no lifts.
+
+    Parameters:
+        gcode_file (str): Path to the G-code file.
+        png_path (str): Destination of the toolpath PNG.
+        heatmap_path (str): Destination of the pen-lift heat map PNG.
+        area_width (float): Width of the plotting area in mm.
+        area_height (float): Height of the plotting area in mm.
+        resolution (float): Pixels per mm.
+        z_up (float): Z position when pen is up in mm.
+        z_down (float): Z position when pen is down in mm.
+        blur (float): Radius of the heat map blur in mm.
+
+    Returns:
+        dict: Draw and travel distances in mm, and the number of pen lifts.
+    """
+    cols = max(1, int(round(area_width * resolution)))
+    rows = max(1, int(round(area_height * resolution)))
+    height = rows - 1e-9
+    draw = np.zeros((rows, cols), dtype=np.int64)
+    travel = np.zeros((rows, cols), dtype=np.int64)
+    lifts = np.zeros((rows, cols), dtype=np.float64)
+    stats = {"draw_distance": 0.0, "travel_distance": 0.0, "pen_lifts": 0}
+
+    for chunk in read_toolpath_chunks(gcode_file, z_up, z_down):
+        for name, counts in (("draw", draw), ("travel", travel)):
+            _rasterize(counts, chunk[name], resolution, height)
+            seg = chunk[name]
+            if len(seg):
+                length = np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1])
+                stats[f"{name}_distance"] += float(length.sum())
+
+        points = chunk["lifts"]
+        if len(points):
+            stats["pen_lifts"] += len(points)
+            px = (points[:, 0] * resolution).astype(np.int64)
+            py = (height - points[:, 1] * resolution).astype(np.int64)
+            inside = (px >= 0) & (px < cols) & (py >= 0) & (py < rows)
+            flat = py[inside] * cols + px[inside]
+            lifts += np.bincount(flat, minlength=rows * cols).reshape(rows, cols)
+
+    image = np.empty((rows, cols, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    image[travel > 0] = TRAVEL_COLOR
+    image[draw > 0] = DRAW_COLOR
+    write_png(png_path, image)
+
+    # Two box passes approximate a gaussian blur
+    radius = int(round(blur * resolution / 2))
+    density = _box_blur(_box_blur(lifts, radius), radius)
+    peak = density.max()
+    if peak > 0:
+        density = density / peak
+    heat = _heat_colors(np.sqrt(density))
+    context = (draw > 0) & (density < 0.02)
+    heat[context] = CONTEXT_COLOR
+    write_png(heatmap_path, heat)
+
+    return stats
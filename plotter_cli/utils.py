@@ -1,3 +1,4 @@
+import shlex
 import yaml
 import xml.etree.ElementTree as ET
 import importlib.resources
@@ -11,8 +12,9 @@ def load_settings():
 
 # Extract width and height from an SVG file
 def get_svg_dimensions(svg_file):
-    tree = ET.parse(svg_file)
-    root = tree.getroot()
+    # Only the root element is needed, so stop parsing as soon as it opens
+    for _, root in ET.iterparse(svg_file, events=("start",)):
+        break
     width = float(root.attrib.get("width", 0))
     height = float(root.attrib.get("height", 0))
     return width, height
@@ -146,3 +148,60 @@ M2 ; End of program
         temp_file.write(config_content)
 
     return temp_path
+
+
+def build_layer_pipeline(
+    output_path,
+    area_width,
+    area_height,
+    registration_marks_length=4,
+    dedupe_tolerance=None,
+    passes=2000,
+    simplify_tolerance=None,
+):
+    """
+    Build the per-layer part of the vpype pipeline used by the process command.
+
+    Parameters:
+        output_path (str): G-code output path, with vpype layer substitutions.
+        area_width (float): Width of the plotting area in mm.
+        area_height (float): Height of the plotting area in mm.
+        registration_marks_length (float): Size of the registration marks in mm.
+        dedupe_tolerance (float): Tolerance of the dedupe stage in mm, or None
+            to skip the stage.
+        passes (int): Number of two-opt passes of linesort; 0 only runs the
+            greedy sort.
+        simplify_tolerance (float): Tolerance of linesimplify in mm, or None
+            to skip the stage.
+
+    Returns:
+        str: vpype commands, from forlayer to end.
+    """
+    marks = registration_marks_length
+    dedupe_command = (
+        f"dedupe --tolerance {dedupe_tolerance}mm "
+        if dedupe_tolerance is not None
+        else ""
+    )
+    simplify_command = (
+        f"linesimplify --tolerance {simplify_tolerance}mm "
+        if simplify_tolerance is not None
+        else ""
+    )
+    two_opt = f"--two-opt --passes {passes} " if passes else ""
+    return (
+        f"forlayer "
+        f"lmove all 999 "
+        f"{simplify_command}"
+        f"{dedupe_command}"
+        f"linemerge linesort {two_opt}"
+        f"rect {marks}mm {marks}mm {marks}mm {marks}mm "
+        f"rect {area_width - 2 * marks}mm {marks}mm {marks}mm {marks}mm "
+        f"rect {marks}mm {area_height - 2 * marks}mm {marks}mm {marks}mm "
+        f"rect {area_width - 2 * marks}mm {area_height - 2 * marks}mm {marks}mm {marks}mm "
+        f"lmove 1 1 "
+        f"lmove 999 2 "
+        f"gwrite -p penplotte {shlex.quote(output_path)} "
+        f"end"
+    )
+
@@ -0,0 +1,109 @@
+import click
+import numpy as np
+import vpype as vp
+import vpype_cli
+
+from .dedupe import dedupe_lines
+
+
+@click.command()
+@click.option(
+    "-t",
+    "--tolerance",
+    type=vpype_cli.LengthType(),
+    default="0.05mm",
+    help="Maximum distance between two strokes to treat them as duplicates.",
+)
+@vpype_cli.layer_processor
+def dedupe(lines: vp.LineCollection, tolerance: float) -> vp.LineCollection:
+    """
+    Remove duplicate and overlapping strokes.
+
+    Segments that retrace already drawn geometry within the tolerance, in
+    either direction, are dropped or trimmed so the plotter only draws them
+    once. The removed drawing distance is reported on stderr.
+    """
+    kept_lines, removed_length = dedupe_lines(
+        (line.tolist() for line in lines), tolerance
+    )
+    if removed_length > 0:
+        click.echo(
+            f"dedupe: removed {removed_length / vp.UNITS['mm']:.1f}mm of duplicate strokes",
+            err=True,
+        )
+    return vp.LineCollection(kept_lines)
+
+
+dedupe.help_group = "Plotter"
+
+
+def _read_spill(base_path, chunk_paths=4096):
+    """Yield the polylines of a spill file pair as complex arrays."""
+    with open(base_path + ".idx", "rb") as index_file, open(
+        base_path + ".xy", "rb"
+    ) as coords_file:
+        while True:
+            counts = np.fromfile(index_file, dtype=np.uint32, count=chunk_paths)
+            if not len(counts):
+                return
+            coords = np.fromfile(
+                coords_file, dtype=np.float32, count=2 * int(counts.sum())
+            ).astype(np.float64)
+            points = coords[0::2] + 1j * coords[1::2]
+            yield from np.split(points, np.cumsum(counts[:-1]))
+
+
+@click.command()
+@click.argument("base_path", type=str)
+@click.option(
+    "--stroke", default="black", help="Stroke colour given to the new layer."
+)
+@click.option(
+    "--scale",
+    type=float,
+    default=1.0,
+    help="Factor converting spilled coordinates to mm.",
+)
+@click.option(
+    "--offset",
+    nargs=2,
+    type=float,
+    default=(0.0, 0.0),
+    help="Offset added to the scaled coordinates, in mm.",
+)
+@click.option(
+    "--page-size",
+    nargs=2,
+    type=float,
+    default=None,
+    help="Page width and height in mm.",
+)
+@vpype_cli.global_processor
+def readspill(document, base_path, stroke, scale, offset, page_size):
+    """
+    Read a layer spilled by the streaming ingest of plotter process.
+
+    BASE_PATH is the spill file path without its .idx/.xy extension. The
+    arrays are loaded straight into a new layer, so no SVG is written or
+    parsed, and the layer gets the stroke colour as its colour.
+    """
+    mm = vp.UNITS["mm"]
+    lines = vp.LineCollection()
+    shift = complex(offset[0], offset[1]) * mm
+    for points in _read_spill(base_path):
+        lines.append(points * (scale * mm) + shift)
+
+    layer_id = document.free_id()
+    document.add(lines, layer_id)
+    try:
+        document.layers[layer_id].set_property(
+            vp.METADATA_FIELD_COLOR, vp.Color(stroke)
+        )
+    except ValueError:
+        click.echo(f"readspill: unsupported stroke colour {stroke}", err=True)
+    if page_size:
+        document.page_size = (page_size[0] * mm, page_size[1] * mm)
+    return document
+
+
+readspill.help_group = "Plotter"
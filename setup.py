@@ -9,11 +9,17 @@ setup(
         "questionary",
         "rich",
         "pyyaml",
+        "vpype",
+        "numpy",
     ],
     entry_points={
         "console_scripts": [
             "plotter=plotter_cli.commands:app",
         ],
+        "vpype.plugins": [
+            "dedupe=plotter_cli.vpype_plugin:dedupe",
+            "readspill=plotter_cli.vpype_plugin:readspill",
+        ],
     },
     author="Your Name",
     description="A CLI tool for managing SVG files and paper sizes.",
@@ -22,7 +28,7 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     package_data={
         "plotter_cli": ["settings.yaml", ".vpype.toml"],
     },
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import shutil
+import subprocess
+
+import pytest
+from typer.testing import CliRunner
+
+from plotter_cli import api
+from plotter_cli.api import _move_into, process, process_many
+from plotter_cli.commands import app
+
+needs_vpype = pytest.mark.skipif(
+    shutil.which("vpype") is None, reason="vpype is not installed"
+)
+
+SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="70mm" '
+    'viewBox="0 0 100 70"><g stroke="red">{lines}</g>'
+    '<path stroke="blue" d="M 10 30 L 90 60"/></svg>'
+)
+
+
+def _svg(tmp_path, name="drawing", rows=2):
+    lines = "".join(
+        f'<line x1="10" y1="{10 + 5 * row}" x2="90" y2="{10 + 5 * row}"/>'
+        for row in range(rows)
+    )
+    path = tmp_path / f"{name}.svg"
+    path.write_text(SVG.format(lines=lines))
+    return str(path)
+
+
+def test_move_into_replaces_the_file_and_its_old_parts(tmp_path):
+    job = tmp_path / "job"
+    out = tmp_path / "out"
+    job.mkdir()
+    out.mkdir()
+    (job / "a_#000000.gcode").write_text("new")
+    (out / "a_#000000.gcode").write_text("old")
+    (out / "a_#000000_part01.gcode").write_text("old part")
+    (out / "a_#000000_from3.gcode").write_text("resumed")
+    (out / "b_#000000_part01.gcode").write_text("other job")
+
+    moved = _move_into(str(job / "a_#000000.gcode"), str(out))
+    assert moved == str(out / "a_#000000.gcode")
+    assert (out / "a_#000000.gcode").read_text() == "new"
+    assert sorted(os.listdir(out)) == [
+        "a_#000000.gcode",
+        "a_#000000_from3.gcode",
+        "b_#000000_part01.gcode",
+    ]
+
+
+@needs_vpype
+def test_process_only_picks_up_its_own_files(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / "other_#000000.gcode").write_text("not ours\n")
+    (out / "drawing_#ff0000_part09.gcode").write_text("stale\n")
+    (out / "drawing_#ff0000_from2.gcode").write_text("resumed\n")
+
+    result = process(
+        _svg(tmp_path), 100, 70, output_folder=str(out), passes=0, join_gap=1.0
+    )
+    assert [os.path.basename(path) for path in result.gcode_files] == [
+        "drawing_#0000ff.gcode",
+        "drawing_#ff0000.gcode",
+    ]
+    assert result.draw_distance > 0
+    assert (out / "other_#000000.gcode").read_text() == "not ours\n"
+    assert (out / "drawing_#ff0000_from2.gcode").exists()
+    # Parts of the replaced file and the job folder are gone
+    assert sorted(os.listdir(out)) == [
+        "drawing_#0000ff.gcode",
+        "drawing_#ff0000.gcode",
+        "drawing_#ff0000_from2.gcode",
+        "other_#000000.gcode",
+    ]
+
+
+@needs_vpype
+def test_jobs_sharing_a_folder_keep_their_files_apart(tmp_path):
+    out = tmp_path / "out"
+    jobs = [
+        (_svg(tmp_path, "first", rows=2), 100, 70),
+        (_svg(tmp_path, "second", rows=4), 100, 70),
+    ]
+    results = asyncio.run(
+        process_many(jobs, output_folder=str(out), passes=0, split_minutes=0.01)
+    )
+    first, second = results
+    assert all(
+        os.path.basename(path).startswith("first_") for path in first.gcode_files
+    )
+    assert all(
+        os.path.basename(path).startswith("second_") for path in second.gcode_files
+    )
+    assert second.draw_distance > first.draw_distance
+    for result in results:
+        for gcode in result.files:
+            assert gcode.parts
+            assert all(os.path.exists(part) for part in gcode.parts)
+
+
+@needs_vpype
+def test_streaming_matches_loading_the_whole_file(tmp_path):
+    # Stream mode reads the width as SVG user units
+    svg = tmp_path / "plain.svg"
+    svg.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="200" height="140">'
+        '<path stroke="red" d="M 20 20 L 180 20 L 180 120"/>'
+        '<path stroke="#00f" d="M 20 120 L 100 60"/></svg>'
+    )
+    whole = process(str(svg), 100, 70, output_folder=str(tmp_path / "whole"), passes=0)
+    streamed = process(
+        str(svg), 100, 70, output_folder=str(tmp_path / "stream"), passes=0, stream=True
+    )
+    assert [os.path.basename(path) for path in streamed.gcode_files] == [
+        os.path.basename(path) for path in whole.gcode_files
+    ]
+    for expected, gcode in zip(whole.files, streamed.files):
+        assert gcode.draw_distance == pytest.approx(expected.draw_distance, rel=1e-4)
+        assert gcode.travel_distance == pytest.approx(
+            expected.travel_distance, rel=1e-4
+        )
+
+
+def test_failed_layer_stops_the_others_before_cleanup(tmp_path, monkeypatch):
+    svg = tmp_path / "plain.svg"
+    svg.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="200" height="140">'
+        '<path stroke="red" d="M 20 20 L 180 20"/>'
+        '<path stroke="blue" d="M 20 120 L 100 60"/></svg>'
+    )
+    stopped = []
+
+    async def run_vpype(args):
+        base_path = args[args.index("--page-size") + 3]
+        if base_path.endswith("layer_1"):
+            raise subprocess.CalledProcessError(1, args)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.append(os.path.exists(base_path + ".xy"))
+            raise
+
+    monkeypatch.setattr(api, "_run_vpype", run_vpype)
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(
+            api._run_streaming(
+                str(svg), "config.toml", "", 100, 70, 385, 460, 0.1, 1024, workers=2
+            )
+        )
+    # The second layer was cancelled while its spill files still existed
+    assert stopped == [True]
+
+
+def test_process_reports_a_missing_vpype(tmp_path, monkeypatch):
+    def missing(*args, **kwargs):
+        raise FileNotFoundError(2, "No such file or directory", "vpype")
+
+    monkeypatch.setattr(api, "process", missing)
+    # No paper has this ratio, so the size is prompted for
+    svg = tmp_path / "odd.svg"
+    svg.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="123" height="45"/>')
+    result = CliRunner().invoke(app, ["process", str(svg)], input="123\n45\n")
+    assert result.exit_code == 1
+    assert "Failed to execute vpype command" in result.output
+    assert "Traceback" not in result.output
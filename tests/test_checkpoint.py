@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from plotter_cli.checkpoint import (
+    add_checkpoints,
+    format_duration,
+    resume_from_checkpoint,
+    scan_program,
+    split_by_duration,
+)
+from plotter_cli.gcode import read_toolpath_chunks, toolpath_stats
+
+HEADER = "G21 ; Set units to mm\nG90 ; Absolute positioning\nG1 Z20 F1500\n"
+FOOTER = "G1 Z20 F1500 ; Pen up\nG0 X0 Y0 ; Home\n"
+
+
+def _program(polylines=10):
+    """A program in the layout gwrite produces, one short polyline per row."""
+    lines = [HEADER]
+    for row in range(polylines):
+        y = 10 * row
+        lines.append(f"G1 Z20 F1500\nG0 X0 Y{y} F6000\nG1 Z0 F1500\n")
+        lines.append(f"G1 X100 Y{y} F1000 ; Draw\nG1 X100 Y{y + 5} F1000 ; Draw\n")
+    lines.append(FOOTER)
+    return "".join(lines)
+
+
+def _draw(path):
+    chunks = [chunk["draw"] for chunk in read_toolpath_chunks(str(path))]
+    return np.concatenate(chunks)
+
+
+@pytest.fixture
+def gcode(tmp_path):
+    path = tmp_path / "layer.gcode"
+    path.write_text(_program())
+    return path
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00:00"
+    assert format_duration(61.5) == "1:01:30"
+
+
+def test_scan_program_finds_polyline_boundaries(gcode):
+    scan = scan_program(str(gcode))
+    # Every polyline but the last ends at a boundary
+    assert len(scan["boundaries"]) == 9
+    assert all(not b.state.pen_down for b in scan["boundaries"])
+    assert scan["header_end"] == 4
+    assert scan["duration"] > 10 * 105 / 1000
+
+
+def test_add_checkpoints_is_idempotent(gcode):
+    assert add_checkpoints(str(gcode)) == 9
+    first = gcode.read_text()
+    assert first.count("; CHECKPOINT") == 9
+    assert add_checkpoints(str(gcode)) == 9
+    assert gcode.read_text() == first
+    # Markers are comments and leave the toolpath unchanged
+    np.testing.assert_array_equal(_draw(gcode), _draw_of(_program(), gcode))
+
+
+def _draw_of(program, near):
+    path = near.parent / "reference.gcode"
+    path.write_text(program)
+    return _draw(path)
+
+
+def test_add_checkpoints_with_interval(gcode):
+    duration = scan_program(str(gcode))["duration"]
+    assert add_checkpoints(str(gcode), interval=duration / 3) == 2
+
+
+def test_resume_draws_the_rest_of_the_job(gcode, tmp_path):
+    add_checkpoints(str(gcode))
+    resumed = tmp_path / "resumed.gcode"
+    skipped = resume_from_checkpoint(str(gcode), 4, str(resumed))
+    assert skipped > 0
+
+    text = resumed.read_text()
+    assert text.startswith(HEADER)
+    assert "G1 Z20 F1500 ; Pen up\nG0 X100.0000 Y35.0000" in text
+    # Polylines 5 to 10 remain
+    np.testing.assert_array_equal(_draw(resumed), _draw(gcode)[8:])
+
+
+def test_resume_from_a_missing_checkpoint(gcode, tmp_path):
+    add_checkpoints(str(gcode))
+    resumed = tmp_path / "resumed.gcode"
+    with pytest.raises(ValueError):
+        resume_from_checkpoint(str(gcode), 42, str(resumed))
+    assert not resumed.exists()
+
+
+def test_resume_over_the_input_file(gcode):
+    add_checkpoints(str(gcode))
+    expected = _draw(gcode)[8:]
+    resume_from_checkpoint(str(gcode), 4, str(gcode))
+    np.testing.assert_array_equal(_draw(gcode), expected)
+
+
+def test_missing_checkpoint_keeps_the_input_file(gcode):
+    add_checkpoints(str(gcode))
+    original = gcode.read_text()
+    with pytest.raises(ValueError):
+        resume_from_checkpoint(str(gcode), 42, str(gcode))
+    assert gcode.read_text() == original
+
+
+def test_missing_checkpoint_keeps_an_existing_output(gcode, tmp_path):
+    add_checkpoints(str(gcode))
+    existing = tmp_path / "existing.gcode"
+    existing.write_text("keep me\n")
+    with pytest.raises(ValueError):
+        resume_from_checkpoint(str(gcode), 42, str(existing))
+    assert existing.read_text() == "keep me\n"
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert names == ["existing.gcode", "layer.gcode"]
+
+
+def test_split_by_duration_keeps_the_toolpath(gcode):
+    duration = scan_program(str(gcode))["duration"]
+    parts = split_by_duration(str(gcode), duration / 3)
+    assert len(parts) == 3
+
+    draws = [_draw(part) for part in parts]
+    np.testing.assert_array_equal(np.concatenate(draws), _draw(gcode))
+    for part in parts:
+        text = open(part).read()
+        assert text.startswith(HEADER)
+        # The closing lines are the ones after the last pen lift
+        assert text.endswith("G0 X0 Y0 ; Home\n")
+        assert toolpath_stats(part)["pen_lifts"] > 0
+
+
+def test_short_programs_are_not_split(gcode):
+    assert split_by_duration(str(gcode), 1000) == []
@@ -0,0 +1,8 @@
+import subprocess
+import sys
+
+
+def test_cli_does_not_import_numpy():
+    # Commands that do not need NumPy must not pay for importing it
+    code = "import sys, plotter_cli.commands; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
@@ -0,0 +1,129 @@
+import cmath
+import math
+
+import pytest
+
+from plotter_cli.dedupe import SegmentGrid, dedupe_lines
+
+
+def _length(lines):
+    return sum(
+        abs(b - a) for line in lines for a, b in zip(line[:-1], line[1:])
+    )
+
+
+def test_dense_polyline_is_kept():
+    line = [complex(i * 0.01, 0) for i in range(1001)]
+    kept, removed = dedupe_lines([line], tolerance=0.05)
+    assert removed == pytest.approx(0.0)
+    assert _length(kept) == pytest.approx(10.0)
+    assert len(kept) == 1
+
+
+def test_dense_circle_is_kept():
+    circle = [10 * cmath.exp(2j * math.pi * i / 2000) for i in range(2001)]
+    kept, removed = dedupe_lines([circle], tolerance=0.05)
+    assert removed == pytest.approx(0.0)
+    assert _length(kept) == pytest.approx(_length([circle]))
+
+
+def test_short_isolated_segment_is_kept():
+    kept, removed = dedupe_lines([[0j, 0.01 + 0j]], tolerance=0.05)
+    assert kept == [[0j, 0.01 + 0j]]
+    assert removed == 0.0
+
+
+def test_exact_duplicate_is_removed():
+    line = [0j, 10 + 0j, 10 + 10j]
+    kept, removed = dedupe_lines([line, list(line)], tolerance=0.05)
+    assert kept == [line]
+    assert removed == pytest.approx(20.0)
+
+
+def test_reversed_duplicate_is_removed():
+    line = [0j, 10 + 0j, 10 + 10j]
+    kept, removed = dedupe_lines([line, line[::-1]], tolerance=0.05)
+    assert kept == [line]
+    assert removed == pytest.approx(20.0)
+
+
+def test_dense_reversed_duplicate_is_removed():
+    line = [complex(i * 0.01, 0) for i in range(1001)]
+    kept, removed = dedupe_lines([line, line[::-1]], tolerance=0.05)
+    assert _length(kept) == pytest.approx(10.0)
+    assert removed == pytest.approx(10.0)
+
+
+def test_near_duplicate_within_tolerance_is_removed():
+    kept, removed = dedupe_lines(
+        [[0j, 10 + 0j], [0.02j, 10 + 0.02j]], tolerance=0.05
+    )
+    assert kept == [[0j, 10 + 0j]]
+    assert removed == pytest.approx(10.0)
+
+
+def test_parallel_line_beyond_tolerance_is_kept():
+    lines = [[0j, 10 + 0j], [1j, 10 + 1j]]
+    kept, removed = dedupe_lines(lines, tolerance=0.05)
+    assert kept == lines
+    assert removed == 0.0
+
+
+def test_partial_overlap_is_trimmed():
+    kept, removed = dedupe_lines([[0j, 10 + 0j], [5 + 0j, 15 + 0j]], tolerance=0.05)
+    assert removed == pytest.approx(5.0)
+    assert kept[0] == [0j, 10 + 0j]
+    assert len(kept) == 2
+    assert kept[1][0] == pytest.approx(10 + 0j)
+    assert kept[1][-1] == 15 + 0j
+
+
+def test_overlap_in_the_middle_splits_the_line():
+    kept, removed = dedupe_lines([[4 + 0j, 6 + 0j], [0j, 10 + 0j]], tolerance=0.05)
+    assert removed == pytest.approx(2.0)
+    assert _length(kept) == pytest.approx(10.0)
+    assert len(kept) == 3
+
+
+def test_closed_polygon_is_kept():
+    square = [0j, 10 + 0j, 10 + 10j, 10j, 0j]
+    kept, removed = dedupe_lines([square], tolerance=0.05)
+    assert kept == [square]
+    assert removed == 0.0
+
+
+def test_closed_polygon_drawn_twice_is_removed():
+    square = [0j, 10 + 0j, 10 + 10j, 10j, 0j]
+    kept, removed = dedupe_lines([square, square[::-1]], tolerance=0.05)
+    assert kept == [square]
+    assert removed == pytest.approx(40.0)
+
+
+def test_grid_covers():
+    grid = SegmentGrid(1.0, 0.05)
+    grid.add(0j, 10 + 0j)
+    assert grid.covers(2 + 0j, 8 + 0j)
+    assert grid.covers(8 + 0.01j, 2 + 0j)
+    assert not grid.covers(5 + 0j, 15 + 0j)
+    assert not grid.covers(0j, 10j)
+    assert not grid.covers(20 + 0j, 20.01 + 0j)
+
+
+def test_long_diagonal_only_fills_cells_along_it():
+    grid = SegmentGrid(1.0, 0.05)
+    grid.add(0j, 280 + 280j)
+    entries = sum(len(bucket) for bucket in grid.cells.values())
+    # A bounding box walk would fill 281 * 281 cells
+    assert entries < 6 * 280
+    assert grid.candidates(140 + 140j, 141 + 141j) == {0}
+    assert grid.candidates(200 + 10j, 201 + 10j) == set()
+
+
+def test_diagonal_duplicate_among_short_segments_is_removed():
+    arcs = [
+        [cmath.rect(radius, i * 0.01) for i in range(200)]
+        for radius in range(10, 60, 5)
+    ]
+    diagonal = [0j, 200 + 200j]
+    kept, removed = dedupe_lines(arcs + [diagonal, diagonal[::-1]], tolerance=0.05)
+    assert removed == pytest.approx(abs(diagonal[1]))
@@ -0,0 +1,107 @@
+import math
+
+import pytest
+
+from plotter_cli.feedplan import (
+    _junction_speeds,
+    _move_seconds,
+    _run_minutes,
+    plan_feed_rates,
+)
+from plotter_cli.gcode import parse_line, toolpath_stats
+
+HEADER = "G21\nG90\nG1 Z20 F1500\nG0 X0 Y0 F6000\nG1 Z0 F1500\n"
+FOOTER = "G1 Z20 F1500 ; Pen up\n"
+
+
+def _segments(points):
+    segments = []
+    for (x0, y0), (x1, y1) in zip(points[:-1], points[1:]):
+        length = math.hypot(x1 - x0, y1 - y0)
+        segments.append((length, (x1 - x0) / length, (y1 - y0) / length))
+    return segments
+
+
+def _write(tmp_path, points, feed=1000):
+    body = "".join(f"G1 X{x} Y{y} F{feed} ; Draw\n" for x, y in points[1:])
+    path = tmp_path / "layer.gcode"
+    path.write_text(HEADER + body + FOOTER)
+    return str(path)
+
+
+def _feeds(path):
+    feeds = []
+    feed = None
+    for line in open(path):
+        words, comment = parse_line(line)
+        feed = words.get("F", feed)
+        if comment == "Draw":
+            feeds.append(feed)
+    return feeds
+
+
+def test_move_seconds_reaches_cruise_speed():
+    # 1s ramps up and down over 25mm each, then 50mm at 50mm/s
+    assert _move_seconds(100, 0, 0, 50, 50) == pytest.approx(3.0)
+
+
+def test_move_seconds_of_a_short_move_peaks_early():
+    # Too short to reach 50mm/s: peaks at sqrt(200)mm/s after 1mm
+    assert _move_seconds(2, 0, 0, 50, 100) == pytest.approx(2 * math.sqrt(200) / 100)
+
+
+def test_move_seconds_without_acceleration():
+    assert _move_seconds(100, 0, 0, 50, 0) == pytest.approx(2.0)
+
+
+def test_junction_speeds_slow_down_for_corners():
+    points = [(0, 0), (100, 0), (200, 0), (200, 100)]
+    speeds = _junction_speeds(_segments(points), [100] * 3, 500, 0.02)
+    assert speeds[0] == speeds[-1] == 0
+    assert speeds[1] == pytest.approx(100)
+    assert 0 < speeds[2] < 10
+
+
+def test_junction_speeds_respect_both_cruise_speeds():
+    points = [(0, 0), (100, 0), (200, 0)]
+    speeds = _junction_speeds(_segments(points), [100, 20], 500, 0.02)
+    assert speeds[1] == pytest.approx(20)
+
+
+def test_run_minutes_includes_acceleration():
+    segments = _segments([(0, 0), (100, 0)])
+    assert _run_minutes(segments, [50], 50, 0.02) == pytest.approx(3.0 / 60)
+
+
+def test_long_straight_moves_are_sped_up(tmp_path):
+    points = [(0, 0), (100, 0), (200, 0), (300, 0)]
+    path = _write(tmp_path, points)
+    before = toolpath_stats(path)
+    stats = plan_feed_rates(path, feed_rate_max=6000, acceleration=500)
+    assert stats["segments"] == 3
+    assert all(feed > 1000 for feed in _feeds(path))
+    assert max(_feeds(path)) == 6000
+    assert stats["duration_after"] < stats["duration_before"]
+    assert toolpath_stats(path) == before
+
+
+def test_tight_curves_keep_their_feed_rate(tmp_path):
+    points = [(0.1 * i, 0.1 * (i % 2)) for i in range(50)]
+    path = _write(tmp_path, points)
+    plan_feed_rates(path, feed_rate_max=6000, acceleration=500)
+    assert set(_feeds(path)) == {1000}
+
+
+def test_estimates_use_the_same_model(tmp_path):
+    # Moves too short to reach even the original feed rate gain nothing
+    points = [(0.1 * i, 0.1 * (i % 2)) for i in range(50)]
+    path = _write(tmp_path, points, feed=100000)
+    stats = plan_feed_rates(path, feed_rate_max=6000, acceleration=500)
+    assert stats["duration_after"] == pytest.approx(stats["duration_before"])
+
+
+def test_feed_rates_are_rounded_to_the_step(tmp_path):
+    points = [(0, 0), (3, 0), (6, 0), (9, 0)]
+    path = _write(tmp_path, points)
+    plan_feed_rates(path, feed_rate_max=6000, acceleration=500, feed_step=250)
+    assert all(feed % 250 == 0 for feed in _feeds(path))
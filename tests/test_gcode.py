@@ -0,0 +1,143 @@
+import random
+import zlib
+
+import numpy as np
+import pytest
+
+from plotter_cli.gcode import (
+    MachineState,
+    _parse_block,
+    _Toolpath,
+    parse_line,
+    read_toolpath_chunks,
+    toolpath_stats,
+)
+from plotter_cli.preview import render_preview
+
+
+def _random_program(rng, lines=400):
+    program = ["G21", "G90"]
+    for _ in range(lines):
+        kind = rng.random()
+        if kind < 0.05:
+            program.append("; comment X99 Y99")
+            continue
+        if kind < 0.08:
+            program.append("")
+            continue
+        words = []
+        if rng.random() < 0.3:
+            words.append(rng.choice(["Z20", "Z0", "Z5.5", "Z-1"]))
+        if rng.random() < 0.8:
+            words.append(f"X{rng.uniform(-50, 300):.3f}")
+        if rng.random() < 0.8:
+            words.append(f"Y{rng.uniform(-50, 300):.4f}")
+        rng.shuffle(words)
+        command = rng.choice(["G0", "G1", "G1", ""])
+        if rng.random() < 0.2:
+            words.append(f"F{rng.randint(100, 9000)}")
+        line = " ".join(filter(None, [command] + words))
+        if rng.random() < 0.1:
+            line += " ; Draw"
+        program.append(line)
+    return "\n".join(program) + "\n"
+
+
+def _interpret(program, vectorized):
+    toolpath = _Toolpath(20, 0)
+    if vectorized:
+        columns = _parse_block(program.encode())
+        assert columns is not None
+        toolpath.add_columns(*columns)
+    else:
+        toolpath.add_lines(program.splitlines(keepends=True))
+    return toolpath.take()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_vectorized_parser_matches_line_interpreter(seed):
+    program = _random_program(random.Random(seed))
+    expected = _interpret(program, vectorized=False)
+    actual = _interpret(program, vectorized=True)
+    for name in ("draw", "travel", "lifts"):
+        assert actual[name].shape == expected[name].shape
+        np.testing.assert_allclose(actual[name], expected[name], atol=1e-9)
+
+
+def test_parse_block_reads_numbers():
+    xs, ys, zs = _parse_block(b"G1 X1.5 Y-2 ; X7\nG0 Z.25\nM3\nG1 Y+3. X0010")
+    np.testing.assert_array_equal(xs, [1.5, np.nan, np.nan, 10.0])
+    np.testing.assert_array_equal(ys, [-2.0, np.nan, np.nan, 3.0])
+    np.testing.assert_array_equal(zs, [np.nan, 0.25, np.nan, np.nan])
+
+
+@pytest.mark.parametrize(
+    "block",
+    [b"G91\nG1 X1\n", b"G20\nG1 X1\n", b"g1 x1\n", b"G1 X1e3\n", b"G1 (note) X1\n"],
+)
+def test_parse_block_defers_unsupported_syntax(block):
+    assert _parse_block(block) is None
+
+
+def test_relative_and_inch_blocks_use_the_line_interpreter(tmp_path):
+    gcode = tmp_path / "relative.gcode"
+    gcode.write_text("G21\nG90\nG1 Z0\nG91\nG1 X10\nG1 Y10\nG90\nG20\nG1 X1\n")
+    chunks = list(read_toolpath_chunks(str(gcode), chunk_lines=1))
+    draw = np.concatenate([chunk["draw"] for chunk in chunks])
+    np.testing.assert_allclose(
+        draw, [[0, 0, 10, 0], [10, 0, 10, 10], [10, 10, 25.4, 10]]
+    )
+
+
+def test_parse_line():
+    assert parse_line("G1 X10 y-2.5 ; Draw\n") == ({"G": 1, "X": 10, "Y": -2.5}, "Draw")
+    assert parse_line("; only a comment") == ({}, "only a comment")
+
+
+def test_machine_state_estimates_durations():
+    state = MachineState(z_up=20, z_down=0, feed_rate_travel=6000)
+    assert state.apply("G0 X60\n") == pytest.approx(60 / 6000)
+    assert not state.pen_down
+    state.apply("G1 Z0 F1000\n")
+    assert state.pen_down
+    assert state.apply("G1 Y100\n") == pytest.approx(100 / 1000)
+    state.apply("G91\n")
+    state.apply("G1 X-60\n")
+    assert (state.x, state.y) == (0, 100)
+
+
+def test_toolpath_stats(tmp_path):
+    gcode = tmp_path / "square.gcode"
+    gcode.write_text(
+        "G0 X10 Y10\nG1 Z0 F1000\nG1 X20\nG1 Y20\nG1 Z20\n"
+        "G0 X0 Y0\nG1 Z0\nG1 X5\nG1 Z20\n"
+    )
+    stats = toolpath_stats(str(gcode))
+    assert stats["draw_distance"] == pytest.approx(25.0)
+    assert stats["travel_distance"] == pytest.approx(200 ** 0.5 + 800 ** 0.5)
+    assert stats["pen_lifts"] == 2
+
+
+def _png_size(path):
+    data = path.read_bytes()
+    assert data.startswith(b"\x89PNG\r\n\x1a\n")
+    width = int.from_bytes(data[16:20], "big")
+    height = int.from_bytes(data[20:24], "big")
+    # The image data must decompress to one filter byte and RGB per row
+    start = data.index(b"IDAT") + 4
+    length = int.from_bytes(data[start - 8 : start - 4], "big")
+    pixels = zlib.decompress(data[start : start + length])
+    assert len(pixels) == height * (1 + 3 * width)
+    return width, height
+
+
+def test_render_preview_writes_pngs(tmp_path):
+    gcode = tmp_path / "square.gcode"
+    gcode.write_text("G0 X10 Y10\nG1 Z0 F1000\nG1 X20\nG1 Y20\nG1 Z20\nG0 X0 Y0\n")
+    png = tmp_path / "preview.png"
+    heatmap = tmp_path / "heatmap.png"
+    stats = render_preview(str(gcode), str(png), str(heatmap), 30, 25, resolution=2)
+    assert stats["draw_distance"] == pytest.approx(20.0)
+    assert stats["pen_lifts"] == 1
+    assert _png_size(png) == (60, 50)
+    assert _png_size(heatmap) == (60, 50)
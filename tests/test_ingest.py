@@ -0,0 +1,143 @@
+import gc
+import weakref
+
+import pytest
+
+from plotter_cli.ingest import (
+    element_polylines,
+    ingest_svg,
+    iter_drawables,
+    page_transform,
+    parse_path,
+    parse_transform,
+)
+
+
+def _svg(tmp_path, body, name="drawing.svg"):
+    path = tmp_path / name
+    path.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="100mm" height="100mm" '
+        f'viewBox="0 0 100 100">{body}</svg>'
+    )
+    return str(path)
+
+
+def _max_radius_error(points, center, radius):
+    return max(abs(abs(p - center) - radius) for p in points)
+
+
+def test_parse_path_lines_and_close():
+    polylines = parse_path("M 0 0 L 10 0 h 5 v 5 z")
+    assert polylines == [[0j, 10 + 0j, 15 + 0j, 15 + 5j, 0j]]
+
+
+def test_parse_path_relative_and_implicit_lineto():
+    polylines = parse_path("m 1 1 2 0 0 2 M 10 10 20 10")
+    assert polylines == [[1 + 1j, 3 + 1j, 3 + 3j], [10 + 10j, 20 + 10j]]
+
+
+def test_parse_path_cubic_stays_within_tolerance():
+    # A quarter circle drawn with the usual cubic approximation
+    k = 0.5522847498 * 10
+    polylines = parse_path(f"M 10 0 C 10 {k} {k} 10 0 10", tolerance=0.01)
+    points = polylines[0]
+    assert points[0] == 10 + 0j
+    assert points[-1] == pytest.approx(10j)
+    assert len(points) > 4
+    assert _max_radius_error(points, 0j, 10) < 0.05
+
+
+def test_parse_path_arc_stays_within_tolerance():
+    polylines = parse_path("M 10 0 A 10 10 0 0 1 -10 0", tolerance=0.01)
+    points = polylines[0]
+    assert points[0] == 10 + 0j
+    assert points[-1] == pytest.approx(-10 + 0j)
+    assert _max_radius_error(points, 0j, 10) < 0.011
+    # Sweep flag 1 goes through positive y
+    assert max(p.imag for p in points) == pytest.approx(10, abs=0.02)
+
+
+def test_parse_path_arc_with_compact_flags():
+    assert parse_path("M0 0a5 5 0 011 1") == parse_path("M0 0 a5 5 0 0 1 1 1")
+
+
+def test_parse_path_arc_with_zero_radius_is_a_line():
+    assert parse_path("M 0 0 A 0 0 0 0 1 10 0") == [[0j, 10 + 0j]]
+
+
+def test_parse_transform():
+    assert parse_transform("translate(10 20)") == (1, 0, 0, 1, 10, 20)
+    assert parse_transform("scale(2)") == (2, 0, 0, 2, 0, 0)
+    a, b, c, d, e, f = parse_transform("rotate(90)")
+    assert (a, b, c, d) == pytest.approx((0, 1, -1, 0))
+    assert parse_transform("translate(5) scale(2)") == (2, 0, 0, 2, 5, 0)
+
+
+def test_circle_is_flattened_within_tolerance(tmp_path):
+    svg = _svg(tmp_path, '<circle cx="50" cy="50" r="20"/>')
+    # Elements are cleared once the walk moves on, so flatten them right away
+    [[points]] = [
+        element_polylines(element, 0.05) for element, _, _ in iter_drawables(svg)
+    ]
+    assert points[0] == pytest.approx(points[-1])
+    assert _max_radius_error(points, 50 + 50j, 20) < 0.06
+
+
+def test_iter_drawables_inherits_stroke_and_transform(tmp_path):
+    svg = _svg(
+        tmp_path,
+        '<defs><path d="M 0 0 L 1 1"/></defs>'
+        '<g stroke="red" transform="translate(10 0)">'
+        '<g transform="scale(2)"><line x1="0" y1="0" x2="1" y2="0"/></g>'
+        '<path stroke="blue" d="M 0 0 L 1 0"/>'
+        '<g style="display:none"><path d="M 0 0 L 1 0"/></g>'
+        "</g>",
+    )
+    found = [(stroke, matrix) for _, stroke, matrix in iter_drawables(svg)]
+    assert found == [
+        ("red", (2, 0, 0, 2, 10, 0)),
+        ("blue", (1, 0, 0, 1, 10, 0)),
+    ]
+
+
+def test_iter_drawables_releases_grouped_elements(tmp_path):
+    paths = "".join(f'<path d="M 0 {i} L 100 {i}"/>' for i in range(200))
+    svg = _svg(tmp_path, f'<g stroke="black"><g>{paths}</g></g>')
+    alive = []
+    most_alive = 0
+    for element, _, _ in iter_drawables(svg):
+        alive.append(weakref.ref(element))
+        del element
+        gc.collect()
+        most_alive = max(most_alive, sum(1 for ref in alive if ref() is not None))
+    assert len(alive) == 200
+    assert most_alive <= 2
+
+
+def test_ingest_svg_buckets_layers_by_stroke(tmp_path):
+    svg = _svg(
+        tmp_path,
+        '<g stroke="red"><line x1="0" y1="0" x2="10" y2="0"/>'
+        '<line x1="0" y1="5" x2="10" y2="5"/></g>'
+        '<rect stroke="blue" x="20" y="20" width="10" height="10"/>',
+    )
+    spill = tmp_path / "spill"
+    spill.mkdir()
+    result = ingest_svg(svg, str(spill), memory_budget=1)
+    try:
+        assert [layer.stroke for layer in result.layers] == ["red", "blue"]
+        assert result.paths == 3
+        assert result.vertices == 9
+        assert result.bounds == (0, 0, 30, 30)
+        red = list(result.layers[0].iter_polylines())
+        assert red == [[(0, 0), (10, 0)], [(0, 5), (10, 5)]]
+    finally:
+        for layer in result.layers:
+            layer.remove()
+
+
+def test_page_transform_centers_the_scaled_document():
+    scale, offset_x, offset_y = page_transform((10, 0, 210, 100), 100, 100, 300, 200)
+    assert scale == 0.5
+    # The document center (110, 50) lands on the page center
+    assert (110 * scale + offset_x, 50 * scale + offset_y) == (150, 100)
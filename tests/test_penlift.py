@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from plotter_cli.gcode import read_toolpath_chunks, toolpath_stats
+from plotter_cli.penlift import _InkedLines, join_short_gaps
+
+HEADER = "G21\nG90\nG1 Z20 F1500\n"
+
+
+def _polyline(start, end, feed=1000):
+    """One polyline as gwrite writes it: lift, travel, lower, draw, lift."""
+    return (
+        f"G1 Z20 F1500\nG0 X{start[0]} Y{start[1]} F6000\nG1 Z0 F1500\n"
+        f"G1 X{end[0]} Y{end[1]} F{feed} ; Draw\nG1 Z20 F1500 ; Pen up\n"
+    )
+
+
+def _write(tmp_path, body):
+    path = tmp_path / "layer.gcode"
+    path.write_text(HEADER + body)
+    return str(path)
+
+
+def _draw(path):
+    return np.concatenate([chunk["draw"] for chunk in read_toolpath_chunks(path)])
+
+
+def test_short_gap_is_joined(tmp_path):
+    path = _write(tmp_path, _polyline((0, 0), (10, 0)) + _polyline((10.5, 0), (20, 0)))
+    stats = join_short_gaps(path, max_gap=1.0, inked_tolerance=None)
+    assert stats["lifts_saved"] == 1
+    assert stats["time_saved"] > 0
+
+    result = toolpath_stats(path)
+    assert result["pen_lifts"] == 1
+    assert result["draw_distance"] == pytest.approx(20.0)
+    assert "Pen-down join" in open(path).read()
+
+
+def test_long_gap_is_kept(tmp_path):
+    body = _polyline((0, 0), (10, 0)) + _polyline((15, 5), (20, 5))
+    path = _write(tmp_path, body)
+    stats = join_short_gaps(path, max_gap=1.0, inked_tolerance=None)
+    assert stats["lifts_saved"] == 0
+    assert open(path).read() == HEADER + body
+
+
+def test_gap_retracing_drawn_lines_is_joined(tmp_path):
+    # The travel back from (10, 0) to (2, 0) runs over the first polyline
+    body = _polyline((0, 0), (10, 0)) + _polyline((2, 0), (2, 10))
+    path = _write(tmp_path, body)
+    stats = join_short_gaps(path, max_gap=1.0)
+    assert stats["lifts_saved"] == 1
+    np.testing.assert_allclose(
+        _draw(path), [[0, 0, 10, 0], [10, 0, 2, 0], [2, 0, 2, 10]]
+    )
+
+
+def test_gap_with_other_commands_is_kept(tmp_path):
+    body = (
+        _polyline((0, 0), (10, 0))
+        + "M0 ; Change pen\n"
+        + _polyline((10.5, 0), (20, 0))
+    )
+    path = _write(tmp_path, body)
+    assert join_short_gaps(path, max_gap=1.0)["lifts_saved"] == 0
+    assert open(path).read() == HEADER + body
+
+
+def test_feed_rate_is_restored_after_a_join(tmp_path):
+    body = (
+        _polyline((0, 0), (10, 0), feed=1000)
+        + "G1 Z20 F1500\nG0 X10.5 Y0 F6000\nG1 Z0 F1500\n"
+        + "G1 X20 Y0 ; Draw\nG1 Z20 F1500 ; Pen up\n"
+    )
+    path = _write(tmp_path, body)
+    assert join_short_gaps(path, max_gap=1.0, inked_tolerance=None)["lifts_saved"] == 1
+    lines = open(path).read().splitlines()
+    join = next(i for i, line in enumerate(lines) if "Pen-down join" in line)
+    assert "F1000" in lines[join]
+    # The next draw relied on F1500 from the dropped Z move
+    assert lines[join + 1] == "F1500 ; Restore feed rate"
+
+
+def test_program_starting_with_the_pen_down(tmp_path):
+    body = "G1 Z0 F1500\nG1 X10 Y0 F1000\n" + _polyline((10.5, 0), (20, 0))
+    path = _write(tmp_path, body)
+    assert join_short_gaps(path, max_gap=1.0)["lifts_saved"] == 1
+    assert toolpath_stats(path)["draw_distance"] == pytest.approx(20.0)
+
+
+def test_only_recent_lines_are_retraced(tmp_path):
+    body = (
+        _polyline((0, 0), (10, 0))
+        + "G1 Z20 F1500\nG0 X10 Y5 F6000\nG1 Z0 F1500\n"
+        + "G1 X10 Y10 F1000 ; Draw\nG1 X10 Y0 F1000 ; Draw\nG1 Z20 F1500 ; Pen up\n"
+        + _polyline((2, 0), (2, 10))
+    )
+    # The travel back to (2, 0) runs over the first line, three draws earlier
+    path = _write(tmp_path, body)
+    assert join_short_gaps(path, max_gap=1.0)["lifts_saved"] == 1
+    path = _write(tmp_path, body)
+    assert join_short_gaps(path, max_gap=1.0, inked_window=1)["lifts_saved"] == 0
+    assert open(path).read() == HEADER + body
+
+
+def test_inked_lines_are_bounded_by_the_window():
+    inked = _InkedLines(10.0, 0.05, window=100)
+    for i in range(1000):
+        inked.add(complex(i, 0), complex(i + 1, 0))
+    assert len(inked) <= 200
+    assert inked.covers(995 + 0j, 999 + 0j)
+    assert not inked.covers(0j, 4 + 0j)
@@ -0,0 +1,196 @@
+import asyncio
+import random
+
+import pytest
+from typer.testing import CliRunner
+
+from plotter_cli.api import calibrate_async
+from plotter_cli.commands import app
+from plotter_cli.preflight import (
+    MIN_FILES,
+    MIN_SAMPLES,
+    PASS_CHOICES,
+    SIMPLIFY_TOLERANCE,
+    CostModel,
+    LayerProfile,
+    SvgProfile,
+    choose_plan,
+    fit_to_area,
+    scan_svg,
+)
+
+MB = 1024 * 1024
+
+
+def _profile(*layers, width=100.0):
+    return SvgProfile(
+        "drawing.svg",
+        width,
+        width,
+        0,
+        {
+            f"#{index:06x}": LayerProfile(paths, vertices, length)
+            for index, (paths, vertices, length) in enumerate(layers)
+        },
+    )
+
+
+def _samples(model, count, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        layers = [
+            (rng.randint(10, 5000), rng.randint(100, 200_000), rng.uniform(100, 1e5))
+            for _ in range(rng.randint(1, 4))
+        ]
+        passes = rng.choice(PASS_CHOICES)
+        samples.append(
+            {
+                "layers": layers,
+                "passes": passes,
+                "seconds": model.predict_seconds(layers, passes),
+                "bytes": model.predict_bytes(layers),
+            }
+        )
+    return samples
+
+
+def test_fit_recovers_the_model():
+    truth = CostModel(
+        [0.8, 3e-6, 4e-5, 1e-4, 2e-5, 1e-8], [1500.0, 40.0, 150.0, 0.5]
+    )
+    model = CostModel.fit(_samples(truth, 40))
+    assert model.samples == 40
+    layers = [(2000, 50_000, 20_000.0), (300, 4000, 1000.0)]
+    for passes in (0, 100, 2000):
+        assert model.predict_seconds(layers, passes) == pytest.approx(
+            truth.predict_seconds(layers, passes), rel=1e-3
+        )
+    assert model.predict_bytes(layers) == pytest.approx(
+        truth.predict_bytes(layers), rel=1e-3
+    )
+    assert min(model.time_coefficients) >= 0
+
+
+def test_fit_needs_enough_samples():
+    with pytest.raises(ValueError):
+        CostModel.fit(_samples(CostModel(), MIN_SAMPLES - 1))
+    assert CostModel.fit(_samples(CostModel(), MIN_SAMPLES)).calibrated
+
+
+def test_fit_needs_distinct_files():
+    # Enough runs, but of too few files to separate the per-file features
+    samples = [
+        dict(sample, passes=passes)
+        for sample in _samples(CostModel(), MIN_FILES - 1)
+        for passes in PASS_CHOICES
+    ]
+    assert len(samples) >= MIN_SAMPLES
+    with pytest.raises(ValueError, match="at least"):
+        CostModel.fit(samples)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "model.json")
+    model = CostModel.fit(_samples(CostModel(), 20))
+    model.save(path)
+    assert CostModel.load(path) == model
+    assert CostModel.load(str(tmp_path / "missing.json")) == CostModel()
+
+
+def test_models_with_other_features_are_ignored(tmp_path):
+    path = tmp_path / "model.json"
+    path.write_text(
+        '{"time_coefficients": [1, 2], "size_coefficients": [1], "samples": 3}'
+    )
+    assert CostModel.load(str(path)) == CostModel()
+
+
+def test_fit_to_area():
+    assert fit_to_area(200, 100, 300, 300) == (300, 150)
+    assert fit_to_area(100, 200, 300, 300) == (150, 300)
+
+
+def test_scan_svg(tmp_path):
+    svg = tmp_path / "drawing.svg"
+    svg.write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">'
+        '<g stroke="red" transform="scale(2)">'
+        '<line x1="0" y1="0" x2="10" y2="0"/><path d="M 0 0 L 3 4 L 3 10"/></g>'
+        '<rect stroke="blue" x="0" y="0" width="10" height="10"/></svg>'
+    )
+    profile = scan_svg(str(svg), 100)
+    assert profile.counts == [(2, 5, 2 * (10 + 5 + 6)), (1, 5, 40)]
+    assert (profile.width, profile.height) == (100, 100)
+    # Lengths are in mm at the target width, whatever the SVG units
+    assert scan_svg(str(svg), 50).counts == [(2, 5, 21), (1, 5, 20)]
+
+
+def test_small_files_keep_the_most_thorough_settings():
+    plan = choose_plan(_profile((100, 1000, 5000.0)), CostModel())
+    assert plan.passes == PASS_CHOICES[0]
+    assert not plan.stream
+    assert plan.simplify_tolerance is None
+
+
+def test_layers_too_large_together_are_streamed():
+    layers = [(1000, 2 * MB, 1e6)] * 3
+    plan = choose_plan(
+        _profile(*layers), CostModel(), memory_budget=256 * MB, cpu_count=2
+    )
+    assert plan.stream
+    assert plan.workers == 2
+    assert plan.simplify_tolerance is None
+    assert any("streaming" in reason for reason in plan.reasons)
+
+
+def test_single_layer_over_the_budget_is_simplified_not_streamed():
+    plan = choose_plan(
+        _profile((1000, 8 * MB, 1e7)), CostModel(), memory_budget=256 * MB
+    )
+    assert not plan.stream
+    assert plan.simplify_tolerance == SIMPLIFY_TOLERANCE
+    assert any("streaming cannot fix" in reason for reason in plan.reasons)
+    assert not any(reason.endswith(": streaming") for reason in plan.reasons)
+
+
+def test_largest_layer_over_the_budget_is_simplified_and_streamed():
+    layers = [(1000, 8 * MB, 1e7), (1000, 1000, 1e4)]
+    plan = choose_plan(_profile(*layers), CostModel(), memory_budget=256 * MB)
+    assert plan.stream
+    assert plan.workers == 1
+    assert plan.simplify_tolerance == SIMPLIFY_TOLERANCE
+
+
+def test_passes_are_limited_by_the_time_budget():
+    profile = _profile((5000, 50_000, 1e5))
+    model = CostModel()
+    plan = choose_plan(profile, model, time_budget=10)
+    assert plan.passes < PASS_CHOICES[0]
+    assert plan.predicted_seconds <= 10
+    assert any("two-opt limited" in reason for reason in plan.reasons)
+
+
+def test_dense_drawings_are_simplified():
+    # 100 000 segments over 100mm: 0.001mm each
+    plan = choose_plan(_profile((10, 100_010, 100.0)), CostModel())
+    assert plan.simplify_tolerance == SIMPLIFY_TOLERANCE
+
+
+def test_calibration_refuses_too_small_a_corpus(tmp_path):
+    (tmp_path / "one.svg").write_text(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+    )
+    with pytest.raises(ValueError):
+        asyncio.run(calibrate_async(str(tmp_path)))
+    for index in range(MIN_FILES - 2):
+        (tmp_path / f"more{index}.svg").write_text(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+        )
+    # Enough runs with many pass counts, but still too few files
+    with pytest.raises(ValueError, match="files"):
+        asyncio.run(calibrate_async(str(tmp_path), passes=(0, 10, 100, 500)))
+
+    result = CliRunner().invoke(app, ["benchmark", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "[ERROR]" in result.output